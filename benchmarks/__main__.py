@@ -0,0 +1,95 @@
+"""
+Run the benchmark suite.
+
+    python -m benchmarks --save results.json
+    python -m benchmarks --compare results.json --threshold 0.1
+
+Exit status is 1 when compared to a baseline some benchmark got slower
+by more than the threshold.
+
+"""
+import argparse
+import fnmatch
+import importlib
+import sys
+from typing import Optional
+
+from .generators import DEFAULT_MAX_SIZE, parse_size
+from .runner import BENCHMARKS, compare, format_result, load, run, save
+
+MODULES = [
+    "bench_lexer",
+    "bench_parser",
+    "bench_builtins",
+    "bench_shell",
+    "bench_spawn",
+]
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = _arguments().parse_args(argv)
+    for module in MODULES:
+        importlib.import_module(f".{module}", __package__)
+
+    max_size = parse_size(args.max_size)
+    selected = [bench for bench in BENCHMARKS if bench.size <= max_size]
+    if args.filter:
+        selected = [b for b in selected if any(f in b.name for f in args.filter)]
+    selected = [
+        bench
+        for bench in selected
+        if not any(fnmatch.fnmatch(bench.name, pattern) for pattern in args.skip)
+    ]
+    if args.list:
+        for bench in selected:
+            print(bench.name)
+        return 0
+
+    print(f"{'benchmark':<44} {'best':>10} {'median':>10}")
+    results = run(selected, report=lambda result: print(format_result(result)))
+    if args.save:
+        save(results, args.save)
+    if args.compare:
+        lines, regressions = compare(load(args.compare), results, args.threshold)
+        print(f"\n{'benchmark':<44} {'baseline':>10} {'current':>10} {'ratio':>8}")
+        print("\n".join(lines))
+        if regressions:
+            print(f"\n{len(regressions)} regressions over {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+def _arguments() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "--filter",
+        action="append",
+        default=[],
+        help="only run benchmarks whose name contains this, may be repeated",
+    )
+    parser.add_argument(
+        "--skip",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="skip benchmarks matching this glob pattern, may be repeated",
+    )
+    parser.add_argument(
+        "--max-size",
+        default=str(DEFAULT_MAX_SIZE),
+        help="largest input in bytes, K, M and G suffixes allowed (default 64M)",
+    )
+    parser.add_argument("--list", action="store_true", help="only list benchmarks")
+    parser.add_argument("--save", metavar="FILE", help="write results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare with saved results")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="slowdown reported as a regression, fraction of baseline time",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""
+Throughput of builtins on files of 1 MiB and more.
+
+Run with `python -m benchmarks --filter builtins`, the 1 GiB file is only
+used with `--max-size 1G`. Output goes to /dev/null, so `cat` measures the
+cost of its zero-copy path rather than of moving data.
+
+"""
+import os
+
+from cli.builtins import Cat, Grep, Sort, Wc
+
+from .generators import FILE_SIZES, log_file, size_name
+from .runner import add
+
+
+def _builtin(cls, args: list[str], size: int):
+    def setup():
+        path = log_file(size)
+        command = cls(cls.__name__.lower(), args + [path])
+
+        def run():
+            with open(os.devnull, "w") as out:
+                command.execute({}, None, out, None)
+
+        return run
+
+    return setup
+
+
+for _size in FILE_SIZES:
+    _name = size_name(_size)
+    add(f"builtins.cat[{_name}]", _builtin(Cat, [], _size), _size, repeat=3)
+    add(f"builtins.wc[{_name}]", _builtin(Wc, [], _size), _size, repeat=3)
+    add(f"builtins.wc-l[{_name}]", _builtin(Wc, ["-l"], _size), _size, repeat=3)
+    _grep = _builtin(Grep, ["-c", "ERROR"], _size)
+    add(f"builtins.grep-c[{_name}]", _grep, _size, repeat=3)
+    # sort spills past 64 MiB of lines, keep it to the smaller files
+    if _size <= 16 << 20:
+        add(f"builtins.sort[{_name}]", _builtin(Sort, [], _size), _size, repeat=3)
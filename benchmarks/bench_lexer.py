@@ -0,0 +1,52 @@
+"""
+Lexer scaling on long lines.
+
+Run with `python -m benchmarks.bench_lexer`, time per byte should stay
+flat as the line grows.
+
+"""
+import timeit
+
+from cli.clilexer import CliLexer
+
+from .generators import ENV, job_line, quoted_line, size_name
+from .runner import add
+
+SIZES = [1 << 16, 1 << 18, 1 << 20]
+
+
+def _tokenize(line: str):
+    def setup():
+        lexer = CliLexer(ENV)
+        return lambda: lexer.tokenize(line)
+
+    return setup
+
+
+for _size in SIZES:
+    _name = size_name(_size)
+    add(f"lexer.tokenize[jobs-{_name}]", _tokenize(job_line(_size)), _size)
+    add(f"lexer.tokenize[quoted-{_name}]", _tokenize(quoted_line(_size)), _size)
+add(
+    "lexer.tokenize[short]",
+    _tokenize("cat access.log | grep -v $LEVEL | sort -k 2 | head -n 10"),
+    number=10000,
+)
+
+
+def main() -> None:
+    lexer = CliLexer(ENV)
+    base = None
+    for size in SIZES:
+        line = job_line(size)
+        best = min(timeit.repeat(lambda: lexer.tokenize(line), number=1, repeat=5))
+        per_kb = best / (size / 1024) * 1e6
+        base = base or per_kb
+        print(
+            f"{size:>8} bytes  {best * 1e3:8.2f} ms  {per_kb:7.2f} us/KiB"
+            f"  x{per_kb / base:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
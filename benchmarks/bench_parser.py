@@ -0,0 +1,46 @@
+"""
+Command factory on deep pipelines and whole parser on typical lines.
+
+Run with `python -m benchmarks --filter parser`.
+
+"""
+from cli.clicommandfactory import CliCommandFactory
+from cli.clilexer import CliLexer
+from cli.cliparser import CliParser
+
+from .generators import ENV, deep_pipeline
+from .runner import add, benchmark
+
+DEPTHS = [10, 100, 1000]
+LINE = "cat access.log | grep -v $LEVEL | sort -k 2 | head -n 10"
+
+
+def _pipeline(depth: int):
+    def setup():
+        tokens = CliLexer(ENV).tokenize(deep_pipeline(depth))
+        factory = CliCommandFactory()
+        return lambda: factory.pipeline(tokens)
+
+    return setup
+
+
+for _depth in DEPTHS:
+    add(f"factory.pipeline[depth-{_depth}]", _pipeline(_depth), number=10)
+
+
+@benchmark("parser.parse[uncached]", number=10000)
+def parse_uncached():
+    parser = CliParser(ENV, cache_size=0)
+    return lambda: parser.parse(LINE)
+
+
+@benchmark("parser.parse[cached]", number=10000)
+def parse_cached():
+    parser = CliParser(ENV)
+    return lambda: parser.parse(LINE)
+
+
+@benchmark("parser.compile+commands", number=10000)
+def plan_commands():
+    plan = CliParser(ENV).compile(LINE)
+    return lambda: plan.commands(ENV)
@@ -0,0 +1,73 @@
+"""
+End-to-end runs of command lines through Shell.
+
+Run with `python -m benchmarks --filter shell`.
+
+"""
+import os
+import shutil
+
+from cli.cliparser import CliParser
+from cli.shell import Shell
+
+from .generators import ENV, log_file
+from .runner import add
+
+SIZE = 16 << 20
+# per-file fan-out runs over this many names of the same 1 MiB file
+FANOUT = 64
+
+PIPELINES = {
+    "fused-wc": "cat {log} | wc -l",
+    "fused-filter": "cat {log} | grep -v INFO | sort -k 2 | head -n 10",
+    "fused-copies": "cat {log} | cat | cat | cat | wc -c",
+    "external-wc": "cat {log} | {wc} -l",
+}
+FANOUTS = {
+    "parallel-1-wc": "cat {listing} | parallel -P 1 wc -l",
+    "parallel-16-wc": "cat {listing} | parallel -P 16 wc -l",
+    "parallel-16-external-wc": "cat {listing} | parallel -P 16 {wc} -l",
+}
+
+
+def _shell(stdin, stdout) -> Shell:
+    env = dict(ENV, PATH=os.environ.get("PATH", os.defpath))
+    return Shell(stdin, stdout, stdout, env, CliParser(env))
+
+
+def _line(template: str):
+    def setup():
+        line = template.format(
+            log=log_file(SIZE), wc=shutil.which("wc") or "wc", listing=_listing()
+        )
+        stdin = open(os.devnull, "r")
+        stdout = open(os.devnull, "w")
+        sh = _shell(stdin, stdout)
+        return lambda: sh.run([line])
+
+    return setup
+
+
+def _listing() -> str:
+    """File naming the same 1 MiB log FANOUT times, one per line."""
+    log = log_file(1 << 20)
+    path = os.path.join(os.path.dirname(log), f"list-{FANOUT}.txt")
+    with open(path, "w") as f:
+        f.write((log + "\n") * FANOUT)
+    return path
+
+
+def _script(lines: list[str]):
+    def setup():
+        sh = _shell(open(os.devnull, "r"), open(os.devnull, "w"))
+        return lambda: sh.run(lines)
+
+    return setup
+
+
+for _name, _template in PIPELINES.items():
+    add(f"shell.run[{_name}]", _line(_template), SIZE, repeat=3)
+for _name, _template in FANOUTS.items():
+    add(f"shell.run[{_name}]", _line(_template), FANOUT << 20, repeat=3)
+add("shell.run[1000-short-lines]", _script(["echo a b c | cat | wc -w"] * 1000))
+add("shell.run[200-external]", _script(["true"] * 200), repeat=3)
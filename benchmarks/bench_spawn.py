@@ -0,0 +1,63 @@
+"""
+Spawn rate of external commands for every backend.
+
+Run with `python -m benchmarks.bench_spawn`.
+
+"""
+import os
+import shutil
+import time
+
+from cli.environment import Environment
+from cli.spawn import POPEN, POSIX_SPAWN, spawn
+
+from .runner import add
+
+SPAWNS = 500
+# variables of the large environments, like a login shell has
+VARIABLES = 300
+
+
+def spawn_rate(backend: str, count: int = SPAWNS) -> float:
+    """Number of `true` processes started and reaped per second."""
+    executable = shutil.which("true")
+    env = dict(os.environ)
+    with open(os.devnull, "r") as sin, open(os.devnull, "w") as sout:
+        start = time.perf_counter()
+        for _ in range(count):
+            spawn(["true"], executable, env, sin, sout, sout, backend).wait()
+        return count / (time.perf_counter() - start)
+
+
+def _spawn(backend: str, variables=None):
+    def setup():
+        executable = shutil.which("true")
+        env = dict(os.environ) if variables is None else variables
+        sin, sout = open(os.devnull, "r"), open(os.devnull, "w")
+        return lambda: spawn(["true"], executable, env, sin, sout, sout, backend).wait()
+
+    return setup
+
+
+def _large() -> dict:
+    env = {f"VARIABLE_{i}": f"value of variable {i}" for i in range(VARIABLES)}
+    return dict(env, **os.environ)
+
+
+for _backend in (POPEN, POSIX_SPAWN):
+    add(f"spawn[{_backend}]", _spawn(_backend), number=100)
+    add(f"spawn[{_backend}-{VARIABLES}-vars]", _spawn(_backend, _large()), number=100)
+    add(
+        f"spawn[{_backend}-{VARIABLES}-vars-cached]",
+        _spawn(_backend, Environment(_large())),
+        number=100,
+    )
+
+
+def main() -> None:
+    for backend in (POPEN, POSIX_SPAWN):
+        print(f"{backend:>12}  {spawn_rate(backend):8.0f} spawns/s")
+
+
+if __name__ == "__main__":
+    main()
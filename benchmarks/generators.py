@@ -0,0 +1,93 @@
+"""
+Inputs of the benchmarks, the same on every run and every machine.
+
+"""
+import os
+import random
+import tempfile
+
+# sizes of files for throughput benchmarks, larger ones only run on request
+FILE_SIZES = [1 << 20, 16 << 20, 64 << 20, 1 << 30]
+DEFAULT_MAX_SIZE = 64 << 20
+
+ENV = {"HOST": "example.org", "PORT": "8080", "USER": "job", "LEVEL": "ERROR"}
+
+_WORDS = (
+    "INFO WARN ERROR request served in ms user id GET POST /api/v1/items status "
+    "200 404 500 cache miss hit retry"
+).split()
+_BLOCK = 1 << 20
+
+
+def job_line(size: int) -> str:
+    """Pipeline of templated job definitions about size characters long."""
+    stage = "run --host=$HOST:$PORT 'literal arg' \"as $USER in $HOST\" plain"
+    return " | ".join([stage] * max(size // (len(stage) + 3), 1))
+
+
+def quoted_line(size: int) -> str:
+    """Line made mostly of quoted strings, with variables inside and between."""
+    rng = random.Random(size)
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(_WORDS)
+        part = rng.choice(
+            [f"'{word} $USER'", f'"{word} $HOST:$PORT"', f"${rng.choice(list(ENV))}"]
+        )
+        parts.append(part)
+        length += len(part) + 1
+    return "echo " + " ".join(parts)
+
+
+def deep_pipeline(depth: int) -> str:
+    """Line of depth stages, each with a few arguments."""
+    return " | ".join(f"grep -v 'stage {i}' \"$LEVEL\"" for i in range(depth))
+
+
+def log_block(seed: int = 0) -> bytes:
+    """1 MiB of log-like lines."""
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    while size < _BLOCK:
+        line = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(3, 12)))
+        lines.append(line)
+        size += len(line) + 1
+    return ("\n".join(lines) + "\n").encode()[:_BLOCK]
+
+
+def log_file(size: int) -> str:
+    """
+    Path of a file of size bytes of log-like lines.
+
+    Files are kept in the temporary directory between runs and only
+    written again when missing.
+
+    """
+    directory = os.path.join(tempfile.gettempdir(), "cli-benchmarks")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"log-{size}.txt")
+    if os.path.exists(path) and os.path.getsize(path) == size:
+        return path
+    block = log_block()
+    partial = path + ".part"
+    with open(partial, "wb") as f:
+        for start in range(0, size, len(block)):
+            f.write(block[: size - start])
+    os.replace(partial, path)
+    return path
+
+
+def size_name(size: int) -> str:
+    for unit, scale in (("GiB", 1 << 30), ("MiB", 1 << 20), ("KiB", 1 << 10)):
+        if size >= scale:
+            return f"{size // scale}{unit}"
+    return f"{size}B"
+
+
+def parse_size(value: str) -> int:
+    """Size like 64M or 1G, plain numbers are bytes."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    unit = units.get(value[-1:].upper())
+    return int(value[:-1]) * unit if unit else int(value)
@@ -0,0 +1,163 @@
+"""
+Registry, runner and result files of the benchmark suite.
+
+A benchmark is a setup function returning the callable to time, so that
+preparing inputs is never measured. Results are saved as JSON keyed by
+benchmark name, two such files can be compared to catch regressions.
+
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from typing import Callable, NamedTuple, Optional
+
+
+class Benchmark(NamedTuple):
+    name: str
+    setup: Callable[[], Callable[[], object]]
+    # bytes processed by one call, 0 when throughput makes no sense
+    size: int = 0
+    number: int = 1
+    repeat: int = 5
+
+
+class Result(NamedTuple):
+    name: str
+    best: float
+    median: float
+    size: int
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """Bytes per second of the best run."""
+        return self.size / self.best if self.size and self.best else None
+
+
+BENCHMARKS: list[Benchmark] = []
+
+
+def add(
+    name: str, setup: Callable, size: int = 0, number: int = 1, repeat: int = 5
+) -> None:
+    """Register setup function returning the callable to time under name."""
+    BENCHMARKS.append(Benchmark(name, setup, size, number, repeat))
+
+
+def benchmark(
+    name: str, size: int = 0, number: int = 1, repeat: int = 5
+) -> Callable[[Callable], Callable]:
+    """Decorator form of `add`."""
+
+    def register(setup: Callable) -> Callable:
+        add(name, setup, size, number, repeat)
+        return setup
+
+    return register
+
+
+def run(benchmarks: list[Benchmark], report: Callable[[Result], None] = None):
+    """Time every benchmark, seconds are per call of the timed function."""
+    results = []
+    for bench in benchmarks:
+        fn = bench.setup()
+        times = [
+            t / bench.number
+            for t in timeit.repeat(fn, number=bench.number, repeat=bench.repeat)
+        ]
+        result = Result(bench.name, min(times), statistics.median(times), bench.size)
+        results.append(result)
+        if report is not None:
+            report(result)
+    return results
+
+
+def format_result(result: Result) -> str:
+    best, median = _seconds(result.best), _seconds(result.median)
+    line = f"{result.name:<44} {best:>10} {median:>10}"
+    if result.throughput is not None:
+        line += f" {result.throughput / (1 << 20):>10.1f} MiB/s"
+    return line
+
+
+def save(results: list[Result], path: str) -> None:
+    data = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "commit": _commit(),
+        },
+        "results": {
+            r.name: {"best": r.best, "median": r.median, "size": r.size}
+            for r in results
+        },
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def load(path: str) -> dict[str, Result]:
+    with open(path) as f:
+        data = json.load(f)
+    return {
+        name: Result(name, r["best"], r["median"], r["size"])
+        for name, r in data["results"].items()
+    }
+
+
+def compare(
+    baseline: dict[str, Result], results: list[Result], threshold: float
+) -> tuple[list[str], list[str]]:
+    """
+    Compare best times with a baseline.
+
+    Returns
+    ----------
+    out : tuple[list[str], list[str]]
+        Report lines and names of benchmarks that got slower by more
+        than threshold, a fraction of the baseline time.
+
+    """
+    lines, regressions = [], []
+    for result in results:
+        old = baseline.get(result.name)
+        if old is None:
+            lines.append(f"{result.name:<44} {'new':>10}")
+            continue
+        ratio = result.best / old.best
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  REGRESSION"
+            regressions.append(result.name)
+        elif ratio < 1 - threshold:
+            mark = "  improved"
+        before, after = _seconds(old.best), _seconds(result.best)
+        lines.append(f"{result.name:<44} {before:>10} {after:>10} {ratio:>7.2f}x{mark}")
+    return lines, regressions
+
+
+def _seconds(value: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if value >= scale:
+            return f"{value / scale:.3f} {unit}"
+    return f"{value / 1e-9:.1f} ns"
+
+
+def _commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except OSError:
+        return None
+    return out.stdout.strip() or None
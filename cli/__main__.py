@@ -1,11 +1,87 @@
 import os
 import sys
+from typing import Optional
 
 from .cliparser import CliParser
+from .environment import Environment
 from .shell import Shell
 
-if __name__ == "__main__":
+# scripts are read in large blocks, lines are split from the buffer
+SCRIPT_BUFSIZE = 1 << 20
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    if argv is None:
+        argv = sys.argv[1:]
+    # plain interactive shell, no need to load argparse
+    args = _arguments(argv) if argv else None
+    profile = os.environ.get("CLI_PROFILE")
+    if args is not None and args.profile is not None:
+        profile = args.profile
+    profiler = None
+    if profile:
+        from .profile import Profiler
+
+        profiler = Profiler(profile)
+    env = Environment(os.environ)
     sh: Shell = Shell(
-        sys.stdin, sys.stdout, sys.stderr, env=os.environ, parser=CliParser(os.environ)
+        sys.stdin,
+        sys.stdout,
+        sys.stderr,
+        env=env,
+        parser=CliParser(env),
+        profiler=profiler,
+    )
+    if os.environ.get("CLI_PIPE_SIZE"):
+        sh.pipe_size = int(os.environ["CLI_PIPE_SIZE"])
+    try:
+        return _run(sh, args)
+    finally:
+        if profiler is not None:
+            profiler.close()
+
+
+def _run(sh: Shell, args) -> int:
+    if args is None:
+        return sh.run()
+    if args.serve is not None:
+        from .server import serve
+
+        return serve(args.serve, sh.env, args.workers)
+    if args.command is not None:
+        return sh.run(args.command.splitlines())
+    if args.script is not None:
+        with open(args.script, "r", buffering=SCRIPT_BUFSIZE) as script:
+            return sh.run(script)
+    return sh.run()
+
+
+def _arguments(argv: list[str]):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="cli")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("-c", dest="command", help="execute command lines and exit")
+    source.add_argument("script", nargs="?", help="execute lines of script and exit")
+    source.add_argument(
+        "--serve", metavar="SOCKET", help="run command lines sent to a Unix socket"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="number of sessions served at the same time"
     )
-    sh.run()
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="append timings of every line as JSON to FILE, also CLI_PROFILE",
+    )
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.serve is None:
+        parser.error("--workers requires --serve")
+    # sessions run on their own shells, none of them is profiled
+    if args.profile is not None and args.serve is not None:
+        parser.error("--profile cannot be used with --serve")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(main())
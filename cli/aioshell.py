@@ -0,0 +1,287 @@
+import asyncio
+import io
+import os
+import sys
+from io import IOBase
+from typing import AsyncIterator, Optional
+
+from .cliparser import CliParser
+from .common import Builtin, Command
+from .environment import environ
+from .parser import Parser
+from .pathcache import path_cache
+from .shell import _print_error, _status
+from .streams import BUFSIZE, fileno, memory_pipe
+from .workers import workers
+
+# `os.open` flags for modes of redirections
+_FLAGS = {
+    "r": os.O_RDONLY,
+    "w": os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+    "a": os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+}
+
+
+class AsyncPipeline:
+    """
+    Pipeline started by `AsyncShell.start`.
+
+    Iterate over it to receive standard output of the last stage in chunks,
+    then await `wait` for the exit status.
+
+    """
+
+    def __init__(self, output: asyncio.StreamReader, stages: list):
+        self._output = output
+        self._stages = stages
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._chunks()
+
+    async def _chunks(self) -> AsyncIterator[bytes]:
+        while chunk := await self._output.read(BUFSIZE):
+            yield chunk
+
+    async def read(self) -> bytes:
+        """Whole remaining output."""
+        return b"".join([chunk async for chunk in self])
+
+    async def wait(self) -> int:
+        """
+        Wait for every stage to finish.
+
+        Returns
+        ----------
+        out : int
+            Exit status of the last stage, the first error of a stage is
+            raised once all of them have finished.
+
+        """
+        # output has to be drained or writers would block forever
+        async for _ in self:
+            pass
+        statuses = await asyncio.gather(
+            *[
+                stage.wait() if isinstance(stage, asyncio.subprocess.Process) else stage
+                for stage in self._stages
+            ],
+            return_exceptions=True,
+        )
+        for status in statuses:
+            if isinstance(status, BaseException):
+                raise status
+        return _status(statuses[-1])
+
+
+class AsyncShell:
+    def __init__(
+        self,
+        env: Optional[dict] = None,
+        parser: Optional[Parser] = None,
+        stderr: IOBase = sys.stderr,
+    ):
+        """
+        Parameters
+        ----------
+        env : dict, optional
+            Dictionary with environment variables, a copy of os.environ
+            by default.
+
+        parser : Parser, optional
+            Parser for command lines, CliParser over env by default.
+
+        stderr : IOBase
+            Open file that stages write their errors to, it must have a
+            file descriptor.
+
+        """
+        if fileno(stderr) is None:
+            raise ValueError("stderr of AsyncShell must have a file descriptor")
+        self.env = dict(os.environ) if env is None else env
+        self.parser = CliParser(self.env) if parser is None else parser
+        self.stderr = stderr
+
+    async def start(self, raw: str, env: Optional[dict] = None) -> AsyncPipeline:
+        """
+        Start a command line without blocking the event loop.
+
+        External commands are run with asyncio subprocesses, builtins on
+        shared worker threads, standard input of the first stage is empty.
+
+        """
+        env = self.env if env is None else env
+        pipeline: list[Command] = self.parser.parse(raw)
+        loop = asyncio.get_running_loop()
+        self.stderr.flush()
+        errfd = fileno(self.stderr)
+        if errfd is None:
+            raise ValueError("stderr of AsyncShell must have a file descriptor")
+
+        # stdin of the next stage, file descriptor or in-memory stream
+        stdin = os.open(os.devnull, os.O_RDONLY)
+        stages: list = []
+        try:
+            for i, command in enumerate(pipeline):
+                last = i == len(pipeline) - 1
+                nxt = None if last else pipeline[i + 1]
+                if isinstance(command, Builtin) and isinstance(nxt, Builtin):
+                    following, stdout = memory_pipe()
+                else:
+                    following, stdout = os.pipe()
+                # stage owns its ends from now on, even if it fails to start
+                current, stdin = stdin, following
+                stages.append(await self._start(command, env, current, stdout, errfd))
+            output = asyncio.StreamReader(loop=loop)
+            await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(output, loop=loop),
+                open(stdin, "rb", buffering=0),
+            )
+        except BaseException:
+            _close(stdin)
+            await _abandon(stages)
+            raise
+        return AsyncPipeline(output, stages)
+
+    async def run(self, raw: str, env: Optional[dict] = None) -> tuple[int, bytes]:
+        """Run a command line, return its exit status and output."""
+        pipeline = await self.start(raw, env)
+        output = await pipeline.read()
+        return await pipeline.wait(), output
+
+    async def _start(self, command: Command, env: dict, stdin, stdout, errfd):
+        """Start one stage, it takes ownership of stdin and stdout."""
+        own_err = False
+        if command.redirects:
+            stdin, stdout, errfd, own_err = _redirect(command, stdin, stdout, errfd)
+        if isinstance(command, Builtin):
+            future = asyncio.get_running_loop().create_future()
+            stage = (command, env, stdin, stdout, errfd, own_err, future)
+            workers.submit(_run_builtin, *stage)
+            return future
+        try:
+            return await asyncio.create_subprocess_exec(
+                command.name,
+                *command.args,
+                executable=path_cache.lookup(command.name, env),
+                stdin=stdin,
+                stdout=stdout,
+                stderr=errfd,
+                env=environ(env),
+            )
+        finally:
+            _close(stdin)
+            _close(stdout)
+            if own_err:
+                os.close(errfd)
+
+
+async def run_pipeline_async(raw: str, env: Optional[dict] = None) -> AsyncPipeline:
+    """
+    Start raw on a default AsyncShell.
+
+    Examples
+    ----------
+    >>> async def main():
+    ...     pipeline = await run_pipeline_async("echo hello | wc -c")
+    ...     async for chunk in pipeline:
+    ...         print(chunk)
+    ...     return await pipeline.wait()
+
+    """
+    return await AsyncShell(env).start(raw)
+
+
+async def _abandon(stages: list) -> None:
+    """Stop stages of a pipeline that failed to start and wait for them."""
+    for stage in stages:
+        if isinstance(stage, asyncio.subprocess.Process):
+            if stage.returncode is None:
+                stage.kill()
+            await stage.wait()
+        else:
+            # builtins end once their pipes are closed
+            await asyncio.gather(stage, return_exceptions=True)
+
+
+def _run_builtin(command, env, stdin, stdout, errfd, own_err, future) -> None:
+    loop = future.get_loop()
+    status = None
+    error = None
+    streams: list[IOBase] = []
+    try:
+        streams.append(_text(stdin, "r"))
+        streams.append(_text(stdout, "w"))
+        streams.append(open(errfd, "w", closefd=own_err))
+        status = command.execute(env, *streams)
+    except (BrokenPipeError, SystemExit):
+        # consumer went away, or `exit` which only ends this pipeline
+        pass
+    except BaseException as e:
+        if own_err and len(streams) == 3:
+            # redirected with 2>, reported there like errors of processes
+            _print_error(streams[2], e)
+            status = 1
+        else:
+            error = e
+    finally:
+        # ends that were not wrapped in a stream yet are closed as they are
+        ends = [stdin, stdout, errfd if own_err else None][len(streams) :]
+        for stream in streams + ends:
+            try:
+                _close(stream)
+            except OSError:
+                pass
+    if error is None:
+        loop.call_soon_threadsafe(_resolve, future, status)
+    else:
+        loop.call_soon_threadsafe(_fail, future, error)
+
+
+def _resolve(future: asyncio.Future, status) -> None:
+    if not future.done():
+        future.set_result(status)
+
+
+def _fail(future: asyncio.Future, error: BaseException) -> None:
+    if not future.done():
+        future.set_exception(error)
+
+
+def _redirect(command: Command, stdin, stdout, errfd: int) -> tuple:
+    """
+    Ends of command with its files opened in place of the given ones.
+
+    Replaced stdin and stdout are closed. The last item tells whether the
+    error descriptor was opened here and has to be closed by the caller.
+
+    """
+    ends = [stdin, stdout, errfd]
+    # stdin and stdout belong to the stage, shell stderr does not
+    owned = [True, True, False]
+    try:
+        for fd, path, mode in command.redirects:
+            opened = os.open(path, _FLAGS[mode] | os.O_CLOEXEC, 0o666)
+            if owned[fd]:
+                _close(ends[fd])
+            ends[fd], owned[fd] = opened, True
+    except BaseException:
+        for end, own in zip(ends, owned):
+            if own:
+                _close(end)
+        raise
+    return ends[0], ends[1], ends[2], owned[2]
+
+
+def _text(end, mode: str) -> IOBase:
+    if isinstance(end, int):
+        return open(end, mode)
+    if mode == "w":
+        return io.TextIOWrapper(io.BufferedWriter(end, BUFSIZE))
+    return io.TextIOWrapper(io.BufferedReader(end, BUFSIZE))
+
+
+def _close(end) -> None:
+    if isinstance(end, int):
+        os.close(end)
+    elif end is not None:
+        end.close()
@@ -1,8 +1,139 @@
-from .cat import Cat
-from .echo import Echo
-from .eq import Eq
-from .exit import Exit
-from .pwd import Pwd
-from .wc import Wc
-
-__all__ = ["Cat", "Echo", "Eq", "Exit", "Pwd", "Wc"]
+"""
+Builtin commands, each imported on first use.
+
+Classes are available as attributes of this package, `lookup` finds the
+class registered under a command name. Other builtins are added with
+`register` or by installed packages through the `cli.builtins` entry point
+group, for example in pyproject.toml:
+
+    [project.entry-points."cli.builtins"]
+    grep = "fastgrep.builtin:Grep"
+
+"""
+import importlib
+from typing import Optional, Union
+
+ENTRY_POINT_GROUP = "cli.builtins"
+
+# command name -> class or "module:Class" reference imported on first lookup,
+# modules starting with '.' are relative to this package
+_REGISTRY: dict[str, Union[type, str]] = {
+    "cat": ".cat:Cat",
+    "echo": ".echo:Echo",
+    "=": ".eq:Eq",
+    "exit": ".exit:Exit",
+    "grep": ".grep:Grep",
+    "hash": ".hash:Hash",
+    "head": ".head:Head",
+    "jobs": ".jobs:Jobs",
+    "parallel": ".parallel:Parallel",
+    "pwd": ".pwd:Pwd",
+    "sort": ".sort:Sort",
+    "tail": ".tail:Tail",
+    "times": ".times:Times",
+    "wait": ".wait:Wait",
+    "wc": ".wc:Wc",
+}
+_CLASSES: dict[str, str] = {ref.rpartition(":")[2]: ref for ref in _REGISTRY.values()}
+_discovered = False
+_generation = 0
+
+__all__ = sorted(_CLASSES) + ["lookup", "register", "unregister", "names"]
+
+
+def lookup(name: str) -> Optional[type]:
+    """Builtin class of command name, None if it is not a builtin."""
+    entry = _REGISTRY.get(name)
+    if entry is None:
+        if _discovered:
+            return None
+        _discover()
+        entry = _REGISTRY.get(name)
+        if entry is None:
+            return None
+    if isinstance(entry, str):
+        entry = _REGISTRY[name] = _load(entry)
+    return entry
+
+
+def register(name: str, builtin: Union[type, str]) -> None:
+    """
+    Make name run builtin instead of an external command.
+
+    Parameters
+    ----------
+    name : str
+        Command name, replaces a builtin that is already registered under it.
+
+    builtin : type or str
+        Subclass of `cli.common.Builtin` or a "module:Class" reference to
+        one, which is not imported until the command is used.
+
+    Pipelines that were already parsed or prepared keep the old binding.
+
+    """
+    global _generation
+    if not isinstance(builtin, str):
+        from ..common import Builtin
+
+        if not (isinstance(builtin, type) and issubclass(builtin, Builtin)):
+            raise TypeError(f"{builtin!r} is not a Builtin subclass")
+    elif ":" not in builtin:
+        raise ValueError(f"expected 'module:Class', got {builtin!r}")
+    _REGISTRY[name] = builtin
+    _generation += 1
+
+
+def unregister(name: str) -> None:
+    """Let name run an external command again."""
+    global _generation
+    _discover()
+    if _REGISTRY.pop(name, None) is not None:
+        _generation += 1
+
+
+def names() -> list[str]:
+    """Names of all registered builtins, plugins included."""
+    _discover()
+    return sorted(_REGISTRY)
+
+
+def generation() -> int:
+    """Counter increased whenever the set of builtins changes."""
+    return _generation
+
+
+def _discover() -> None:
+    """Register builtins of installed plugins, only the first call does work."""
+    global _discovered, _generation
+    if _discovered:
+        return
+    from importlib.metadata import entry_points
+
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        group = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        # Python 3.9 returns a dict of groups
+        group = eps.get(ENTRY_POINT_GROUP, ())
+    found = False
+    for ep in group:
+        # explicit registrations and our own builtins take precedence
+        if ep.name not in _REGISTRY:
+            _REGISTRY[ep.name] = ep.value
+            found = True
+    _discovered = True
+    if found:
+        _generation += 1
+
+
+def _load(ref: str) -> type:
+    module, _, cls = ref.partition(":")
+    package = __name__ if module.startswith(".") else None
+    return getattr(importlib.import_module(module, package), cls)
+
+
+def __getattr__(name: str) -> type:
+    if name in _CLASSES:
+        return _load(_CLASSES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
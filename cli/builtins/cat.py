@@ -1,15 +1,36 @@
+import os
 from io import IOBase
 
-from ..common import Command
+from ..common import Builtin
+from ..streams import copy
 
 
-class Cat(Command):
+class Cat(Builtin):
+    streaming = binary_safe = pure = True
+
     def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
         if not self.args:
-            for line in stdin:
-                stdout.write(line)
+            copy(stdin, stdout)
             return
-        for arg in self.args:
-            with open(arg, "r") as f:
-                for line in f:
-                    stdout.write(line)
+        for i, arg in enumerate(self.args):
+            with open(arg, "rb", buffering=0) as f:
+                if i + 1 < len(self.args):
+                    _prefetch(self.args[i + 1])
+                copy(f, stdout)
+
+
+def _prefetch(path: str) -> None:
+    """Let the kernel read next file in while the current one is written out."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # reported when it is actually opened
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
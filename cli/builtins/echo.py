@@ -1,8 +1,11 @@
 from io import IOBase
 
-from ..common import Command
+from ..common import Builtin
+from ..streams import write_text
 
 
-class Echo(Command):
+class Echo(Builtin):
+    streaming = binary_safe = pure = True
+
     def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
-        stdout.write(" ".join(self.args) + "\n")
+        write_text(stdout, " ".join(self.args) + "\n")
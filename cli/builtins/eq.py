@@ -1,8 +1,11 @@
 from io import IOBase
 
-from ..common import Command
+from ..common import Builtin
+from ..pathcache import path_cache
 
 
-class Eq(Command):
+class Eq(Builtin):
     def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
         env[self.args[0]] = self.args[1]
+        if self.args[0] == "PATH":
+            path_cache.clear()
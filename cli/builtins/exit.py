@@ -1,8 +1,8 @@
 from io import IOBase
 
-from ..common import Command
+from ..common import Builtin
 
 
-class Exit(Command):
+class Exit(Builtin):
     def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
         raise SystemExit()
@@ -0,0 +1,119 @@
+import re
+from io import IOBase
+from typing import Optional
+
+from ..common import Builtin
+from ..streams import byte_output, line_blocks, write_all
+
+
+class Grep(Builtin):
+    streaming = binary_safe = pure = True
+
+    def execute(
+        self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase
+    ) -> Optional[int]:
+        flags, pattern, files = _parse(self.args)
+        matcher = Matcher(pattern, fixed="F" in flags, ignore_case="i" in flags)
+        invert, count = "v" in flags, "c" in flags
+        out = byte_output(stdout)
+        selected = 0
+        if not files:
+            selected = matcher.filter(stdin, out, invert, count)
+        for arg in files:
+            prefix = f"{arg}:".encode() if len(files) > 1 else b""
+            with open(arg, "rb", buffering=0) as f:
+                selected += matcher.filter(f, out, invert, count, prefix)
+        out.flush()
+        # like grep, status 1 means nothing was selected
+        return None if selected else 1
+
+
+class Matcher:
+    """
+    Line filter working on blocks of lines rather than on single lines.
+
+    A block without a single match is skipped by one `bytes.find` or regex
+    search, only blocks that have one are split into lines. Patterns
+    without special characters always take the substring path.
+
+    """
+
+    def __init__(self, pattern: str, fixed: bool = False, ignore_case: bool = False):
+        raw = pattern.encode()
+        self._needle: Optional[bytes] = None
+        if not ignore_case and (fixed or re.escape(pattern) == pattern):
+            self._needle = raw
+        else:
+            self._search = re.compile(
+                re.escape(raw) if fixed else raw,
+                re.MULTILINE | (re.IGNORECASE if ignore_case else 0),
+            ).search
+
+    def filter(
+        self,
+        f: IOBase,
+        out: IOBase,
+        invert: bool = False,
+        count: bool = False,
+        prefix: bytes = b"",
+    ) -> int:
+        """
+        Write selected lines of f to out, or their number if count is set.
+
+        Returns
+        ----------
+        out : int
+            Number of selected lines.
+
+        """
+        selected = 0
+        for block in line_blocks(f):
+            lines = self.select(block, invert)
+            selected += len(lines)
+            if lines and not count:
+                write_all(out, prefix + (b"\n" + prefix).join(lines) + b"\n")
+        if count:
+            write_all(out, prefix + f"{selected}\n".encode())
+        return selected
+
+    def select(self, block: bytes, invert: bool = False) -> list[bytes]:
+        """Lines of block that match, or that do not when invert is set."""
+        needle = self._needle
+        if needle is not None:
+            skip = needle not in block
+        else:
+            skip = self._search(block) is None
+        if skip and not invert:
+            return []
+        lines = block.split(b"\n")
+        if not lines[-1]:
+            lines.pop()
+        if skip:
+            return lines
+        if needle is not None:
+            if invert:
+                return [line for line in lines if needle not in line]
+            return [line for line in lines if needle in line]
+        search = self._search
+        if invert:
+            return [line for line in lines if search(line) is None]
+        return [line for line in lines if search(line) is not None]
+
+
+def _parse(args: list[str]) -> tuple[str, str, list[str]]:
+    flags = ""
+    rest = []
+    for i, arg in enumerate(args):
+        if arg == "--":
+            rest.extend(args[i + 1 :])
+            break
+        if rest or len(arg) < 2 or not arg.startswith("-"):
+            rest.append(arg)
+            continue
+        unknown = set(arg[1:]) - set("cvFi")
+        if unknown:
+            raise ValueError(f"grep: invalid option -- '{unknown.pop()}'")
+        flags += arg[1:]
+    if not rest:
+        raise ValueError("usage: grep [-cvFi] pattern [file ...]")
+    return flags, rest[0], rest[1:]
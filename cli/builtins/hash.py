@@ -0,0 +1,23 @@
+from io import IOBase
+
+from ..common import Builtin
+from ..pathcache import path_cache
+
+
+class Hash(Builtin):
+    def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
+        if not self.args:
+            entries = path_cache.entries()
+            if not entries:
+                stdout.write("hash: hash table empty\n")
+                return
+            stdout.write("hits\tcommand\n")
+            for _, path, hits in entries:
+                stdout.write(f"{hits:>4}\t{path}\n")
+            return
+        for arg in self.args:
+            if arg == "-r":
+                path_cache.clear()
+                continue
+            if path_cache.lookup(arg, env) is None:
+                stderr.write(f"hash: {arg}: not found\n")
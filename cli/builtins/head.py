@@ -0,0 +1,68 @@
+from io import IOBase
+
+from ..common import Builtin
+from ..streams import byte_output, chunks, write_all
+
+
+class Head(Builtin):
+    streaming = binary_safe = pure = True
+
+    def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
+        value, files = parse_count(self.args, "head", "10")
+        count = int(value)
+        out = byte_output(stdout)
+        if not files:
+            head(stdin, out, count)
+        for i, arg in enumerate(files):
+            if len(files) > 1:
+                header = ("\n" if i else "") + f"==> {arg} <==\n"
+                write_all(out, header.encode())
+            with open(arg, "rb", buffering=0) as f:
+                head(f, out, count)
+        out.flush()
+
+
+def head(f: IOBase, out: IOBase, count: int) -> None:
+    """
+    Copy first count lines of f to out.
+
+    Nothing past the chunk holding the last of them is read, the caller
+    closing f right after is what stops a producer on the other end.
+
+    """
+    if count <= 0:
+        return
+    for chunk in chunks(f):
+        lines = chunk.count(b"\n")
+        if lines < count:
+            write_all(out, chunk)
+            count -= lines
+            continue
+        end = -1
+        for _ in range(count):
+            end = chunk.index(b"\n", end + 1)
+        write_all(out, chunk[: end + 1])
+        return
+
+
+def parse_count(args: list[str], command: str, default: str) -> tuple[str, list[str]]:
+    """Split `-n [+]N`, `-n[+]N` or `-N` line count off the file arguments."""
+    count = default
+    files: list[str] = []
+    it = iter(args)
+    for arg in it:
+        if arg == "-n":
+            value = next(it, None)
+            if value is None:
+                raise ValueError(f"{command}: option requires an argument -- 'n'")
+        elif arg.startswith("-n"):
+            value = arg[2:]
+        elif len(arg) > 1 and arg.startswith("-"):
+            value = arg[1:]
+        else:
+            files.append(arg)
+            continue
+        if not value.removeprefix("+").isdigit():
+            raise ValueError(f"{command}: invalid number of lines: '{value}'")
+        count = value
+    return count, files
@@ -0,0 +1,16 @@
+from io import IOBase
+
+from ..common import Builtin
+
+
+class Jobs(Builtin):
+    def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
+        shell = self.shell
+        if shell is None:
+            return
+        shell.reap()
+        for job_id, job in list(shell.jobs.items()):
+            stdout.write(f"[{job_id}]  {job.state:<8}{job.command}\n")
+            if job.status is not None:
+                # finished jobs are listed once, like in other shells
+                del shell.jobs[job_id]
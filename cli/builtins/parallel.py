@@ -0,0 +1,234 @@
+import os
+import queue
+import sys
+import threading
+from functools import partial
+from io import BytesIO, IOBase, StringIO, TextIOWrapper
+from typing import Callable, Iterable, Iterator, Optional
+
+from ..clicommandfactory import create_command
+from ..common import Builtin, Command
+from ..streams import byte_output, line_blocks, pipe, write_all
+from ..workers import processes, workers
+
+# with -k, items started ahead of the first unfinished one, per job slot
+_WINDOW = 4
+# pool processes only pay off when they can run at the same time
+_CPUS = os.cpu_count() or 1
+
+
+class Parallel(Builtin):
+    streaming = binary_safe = True
+
+    def execute(
+        self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase
+    ) -> Optional[int]:
+        jobs, keep_order, template = _parse(self.args)
+        out = byte_output(stdout)
+        failed = parallel(
+            _items(stdin), template, env, out, stderr, jobs, keep_order, self.shell
+        )
+        out.flush()
+        # like xargs, 123 means some of the commands failed
+        return 123 if failed else None
+
+
+def parallel(
+    items: Iterable[str],
+    template: list[str],
+    env: dict,
+    out: IOBase,
+    stderr: IOBase,
+    jobs: int,
+    keep_order: bool = False,
+    shell=None,
+) -> int:
+    """
+    Run template once for every item, at most jobs at the same time.
+
+    Every `{}` in template is replaced with the item, without one the item
+    is appended. External commands are spawned from worker threads, pure
+    builtins run in the shared process pool when more than one job and CPU
+    are available, other builtins on worker threads. The output of
+    every command is written to out as a whole once it is finished, in
+    order of items if keep_order is set, and ends with a newline even when
+    the command printed none, like the counts of wc.
+
+    Returns
+    ----------
+    out : int
+        Number of commands that failed.
+
+    """
+    results: queue.SimpleQueue = queue.SimpleQueue()
+    # builtins that are not pure never run at the same time
+    lock = threading.Lock()
+    # finished but not yet written outputs with keep_order, by index
+    finished: dict[int, bytes] = {}
+    running = written = failed = 0
+    pool_env: Optional[dict] = None
+
+    def collect() -> None:
+        nonlocal running, written, failed
+        index, output, status = results.get()
+        running -= 1
+        failed += status != 0
+        if not keep_order:
+            write_all(out, output)
+            out.flush()
+            return
+        finished[index] = output
+        while written in finished:
+            write_all(out, finished.pop(written))
+            written += 1
+        out.flush()
+
+    with open(os.devnull, "r") as devnull:
+        try:
+            for index, item in enumerate(items):
+                while running >= jobs or (
+                    keep_order and index - written >= jobs * _WINDOW
+                ):
+                    collect()
+                command = create_command(_argv(template, item))
+                report = (command, results, index, stderr)
+                if jobs > 1 and _CPUS > 1 and _poolable(command):
+                    if pool_env is None:
+                        # os.environ and the like are sent as a plain copy
+                        pool_env = dict(env)
+                    future = processes().submit(
+                        _run_pure, type(command), command.name, command.args, pool_env
+                    )
+                    future.add_done_callback(partial(_run, *report, _result, stderr))
+                else:
+                    if isinstance(command, Builtin):
+                        command.shell = shell
+                    args = (command, env, devnull, stderr, lock)
+                    workers.submit(_run, *report, _capture, *args)
+                running += 1
+            while running:
+                collect()
+        finally:
+            # commands still running must not be left with a closed stdin
+            while running:
+                results.get()
+                running -= 1
+    return failed
+
+
+def _run(
+    command: Command,
+    results: queue.SimpleQueue,
+    index: int,
+    stderr: IOBase,
+    fn: Callable[..., tuple[bytes, int]],
+    *args,
+) -> None:
+    """Put output and status of command that fn(*args) returns into results."""
+    output, status = b"", 1
+    try:
+        output, status = fn(*args)
+        if output and not output.endswith(b"\n"):
+            output += b"\n"
+    except FileNotFoundError:
+        stderr.write(f"parallel: {command.name}: command not found\n")
+        status = 127
+    except BaseException as e:
+        message = str(e)
+        if not message.startswith(f"{command.name}:"):
+            message = f"{command.name}: {message}"
+        stderr.write(f"parallel: {message}\n")
+    finally:
+        results.put((index, output, status))
+
+
+def _run_pure(cls: type, name: str, args: list[str], env: dict) -> tuple:
+    """Run a pure builtin in a pool process, errors it prints are sent back."""
+    errors = StringIO()
+    with open(os.devnull, "r") as stdin:
+        output, status = _capture(cls(name, args), env, stdin, errors, None)
+    return output, status, errors.getvalue()
+
+
+def _result(stderr: IOBase, future) -> tuple[bytes, int]:
+    output, status, errors = future.result()
+    if errors:
+        stderr.write(errors)
+    return output, status
+
+
+def _capture(
+    command: Command,
+    env: dict,
+    stdin: IOBase,
+    stderr: IOBase,
+    lock: Optional[threading.Lock],
+) -> tuple[bytes, int]:
+    """Run command to completion, returning its output and exit status."""
+    if isinstance(command, Builtin):
+        buffer = BytesIO()
+        stdout = buffer if command.binary_safe else TextIOWrapper(buffer)
+        if command.pure:
+            status = command.execute(env, stdin, stdout, stderr)
+        else:
+            with lock:
+                status = command.execute(env, stdin, stdout, stderr)
+        stdout.flush()
+        return buffer.getvalue(), status or 0
+    reader, writer = pipe()
+    with reader:
+        try:
+            process = command.start(env, stdin, writer, stderr)
+        finally:
+            # the process has its own copy, EOF comes when it exits
+            writer.close()
+        output = reader.buffer.read()
+    return output, process.wait()
+
+
+def _poolable(command: Command) -> bool:
+    """Check that command is a pure builtin pool processes can import."""
+    if not (isinstance(command, Builtin) and command.pure):
+        return False
+    cls = type(command)
+    return getattr(sys.modules.get(cls.__module__), cls.__qualname__, None) is cls
+
+
+def _items(stdin: IOBase) -> Iterator[str]:
+    """Non-empty lines of stdin, as they arrive."""
+    for block in line_blocks(stdin):
+        for line in block.split(b"\n"):
+            if line:
+                yield line.decode(errors="surrogateescape")
+
+
+def _argv(template: list[str], item: str) -> list[str]:
+    if not any("{}" in arg for arg in template):
+        return template + [item]
+    return [arg.replace("{}", item) for arg in template]
+
+
+def _parse(args: list[str]) -> tuple[int, bool, list[str]]:
+    jobs = os.cpu_count() or 1
+    keep_order = False
+    it = iter(args)
+    for arg in it:
+        if arg == "--":
+            break
+        if len(arg) < 2 or not arg.startswith("-"):
+            # first word of the command
+            it = iter([arg, *it])
+            break
+        if arg == "-k":
+            keep_order = True
+            continue
+        if arg[:2] not in ("-P", "-j"):
+            raise ValueError(f"parallel: invalid option -- '{arg[1]}'")
+        value = arg[2:] or next(it, "")
+        if not value.isdigit() or not int(value):
+            raise ValueError(f"parallel: invalid number of jobs '{value}'")
+        jobs = int(value)
+    template = list(it)
+    if not template:
+        raise ValueError("usage: parallel [-k] [-P N] command [arg ...]")
+    return jobs, keep_order, template
@@ -1,8 +1,11 @@
 from io import IOBase
 
-from ..common import Command
+from ..common import Builtin
+from ..streams import write_text
 
 
-class Pwd(Command):
+class Pwd(Builtin):
+    streaming = binary_safe = pure = True
+
     def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
-        stdout.write(env.get("PWD", ""))
+        write_text(stdout, env.get("PWD", ""))
@@ -0,0 +1,320 @@
+import heapq
+import re
+import tempfile
+from contextlib import ExitStack
+from decimal import Decimal
+from io import IOBase
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+from ..common import Builtin
+from ..streams import BUFSIZE, byte_output, line_blocks, write_all
+
+# rough per-line cost of the objects holding a line besides its bytes
+_OVERHEAD = 64
+# sorted runs merged at once, more are first merged in several passes
+_FAN_IN = 32
+# fields are runs of non-blanks with the blanks before them, as in GNU sort
+_BLANKS = rb"[ \t\n]*"
+_FIELD = rb"[ \t\n]*[^ \t\n]*"
+_NUMBER = re.compile(rb"[ \t\n]*(-?)(\d*)(?:\.(\d*))?")
+_KEY = re.compile(r"(\d+)(?:\.(\d+))?([bnr]*)(?:,(\d+)(?:\.(\d+))?([bnr]*))?")
+_UNITS = {"b": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+_MISSING = object()
+
+
+class Key(NamedTuple):
+    # first field and its first character, both counted from 1
+    start: int
+    start_char: int = 1
+    # last field, None for the end of the line, last character 0 for all of it
+    end: Optional[int] = None
+    end_char: int = 0
+    # skip blanks before the first and the last character, like -b
+    skip_start: bool = False
+    skip_end: bool = False
+    numeric: bool = False
+    reverse: bool = False
+
+
+class Options(NamedTuple):
+    numeric: bool = False
+    reverse: bool = False
+    unique: bool = False
+    blanks: bool = False
+    key: Optional[Key] = None
+    budget: Optional[int] = None
+
+
+class Sort(Builtin):
+    binary_safe = pure = True
+
+    # bytes of input kept in memory, past that sorted runs go to temp files
+    memory_budget: int = 256 << 20
+
+    def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
+        options, files = _parse(self.args)
+        budget = options.budget or self.memory_budget
+        out = byte_output(stdout)
+        with ExitStack() as stack:
+            inputs = [stdin] if not files else []
+            for arg in files:
+                inputs.append(stack.enter_context(open(arg, "rb", buffering=0)))
+            lines = sort(_lines(inputs), options, budget, env.get("TMPDIR"))
+            _write(out, lines)
+        out.flush()
+
+
+def sort(
+    lines: Iterable[bytes],
+    options: Options = Options(),
+    budget: int = Sort.memory_budget,
+    tmpdir: Optional[str] = None,
+) -> Iterator[bytes]:
+    """
+    Sort lines given without their b"\\n", using at most about budget bytes.
+
+    Whenever the lines held in memory exceed budget they are sorted and
+    written to a temporary file in tmpdir, at the end all such runs are
+    merged. Like in GNU sort in the C locale, lines with equal keys are
+    ordered by the whole line, unless only unique keys are kept, then the
+    first line seen wins.
+
+    """
+    primary = _primary(options)
+    if primary is None or options.unique:
+        key = primary
+    else:
+
+        def key(line: bytes) -> tuple:
+            return primary(line), line
+
+    reverse = options.reverse
+    with ExitStack() as stack:
+        runs: list[Iterable[bytes]] = []
+        batch: list[bytes] = []
+        size = 0
+        for line in lines:
+            batch.append(line)
+            size += len(line) + _OVERHEAD
+            if size >= budget:
+                batch.sort(key=key, reverse=reverse)
+                runs.append(_spill(stack, batch, tmpdir))
+                batch, size = [], 0
+        batch.sort(key=key, reverse=reverse)
+        while len(runs) > _FAN_IN:
+            # neighbouring runs are merged, so equal keys keep input order
+            runs = [
+                _spill(stack, _merge(runs[i : i + _FAN_IN], key, reverse), tmpdir)
+                for i in range(0, len(runs), _FAN_IN)
+            ]
+        result: Iterable[bytes] = batch
+        if runs:
+            result = _merge(runs + [batch], key, reverse)
+        if options.unique:
+            result = _unique(result, primary)
+        yield from result
+
+
+def _primary(options: Options) -> Optional[Callable[[bytes], object]]:
+    """Key lines are compared by before the whole line, None for the line itself."""
+    key = options.key
+    if key is None:
+        if not (options.numeric or options.blanks):
+            return None
+        key = Key(
+            1,
+            skip_start=options.blanks,
+            numeric=options.numeric,
+            reverse=options.reverse,
+        )
+    extract = _extract(key)
+    if key.numeric:
+
+        def primary(line: bytes):
+            return _number(extract(line))
+
+    else:
+        primary = extract
+    if key.reverse == options.reverse:
+        return primary
+
+    def inverted(line: bytes) -> "_Inverted":
+        return _Inverted(primary(line))
+
+    return inverted
+
+
+def _extract(key: Key) -> Callable[[bytes], bytes]:
+    """Function returning the part of a line key covers, like GNU sort finds it."""
+    start = rb"(?:%s){%d}" % (_FIELD, key.start - 1)
+    if key.skip_start:
+        start += _BLANKS
+    begin = re.compile(start).match
+    offset = key.start_char - 1
+    if key.end is None:
+
+        def extract(line: bytes) -> bytes:
+            return line[begin(line).end() + offset :]
+
+        return extract
+
+    # without a last character the whole last field is skipped
+    end = rb"(?:%s){%d}" % (_FIELD, key.end if not key.end_char else key.end - 1)
+    if key.end_char and key.skip_end:
+        end += _BLANKS
+    limit = re.compile(end).match
+    chars = key.end_char
+
+    def extract(line: bytes) -> bytes:
+        # a key ending before it starts is empty, slicing makes it so
+        return line[begin(line).end() + offset : limit(line).end() + chars]
+
+    return extract
+
+
+def _number(key: bytes):
+    """Exact value of the number key starts with, 0 when there is none."""
+    sign, whole, fraction = _NUMBER.match(key).groups()
+    fraction = (fraction or b"").rstrip(b"0")
+    if not fraction:
+        return int(sign + whole) if whole else 0
+    return Decimal(f"{sign.decode()}{whole.decode() or 0}.{fraction.decode()}")
+
+
+class _Inverted:
+    """Key of its own direction, compared the other way round."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other: "_Inverted") -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Inverted) and other.value == self.value
+
+
+def _unique(
+    lines: Iterable[bytes], primary: Optional[Callable[[bytes], object]]
+) -> Iterator[bytes]:
+    """First of every run of lines with equal keys."""
+    previous = _MISSING
+    for line in lines:
+        key = line if primary is None else primary(line)
+        if key != previous:
+            yield line
+            previous = key
+
+
+def _spill(stack: ExitStack, lines: Iterable[bytes], tmpdir: Optional[str]) -> IOBase:
+    run = stack.enter_context(tempfile.TemporaryFile(dir=tmpdir))
+    _write(run, lines)
+    run.flush()
+    return run
+
+
+def _merge(runs: list, key, reverse: bool) -> Iterator[bytes]:
+    runs = [run if isinstance(run, list) else _read(run) for run in runs]
+    return heapq.merge(*runs, key=key, reverse=reverse)
+
+
+def _read(run: IOBase) -> Iterator[bytes]:
+    """Lines of a spilled run, without their b"\\n" again."""
+    run.seek(0)
+    for line in run:
+        yield line[:-1]
+
+
+def _lines(inputs: list[IOBase]) -> Iterator[bytes]:
+    for f in inputs:
+        for block in line_blocks(f):
+            lines = block.split(b"\n")
+            last = lines.pop()
+            yield from lines
+            if last:
+                yield last
+
+
+def _write(out: IOBase, lines: Iterable[bytes]) -> None:
+    batch: list[bytes] = []
+    size = 0
+    for line in lines:
+        batch.append(line)
+        size += len(line) + 1
+        if size >= BUFSIZE:
+            batch.append(b"")
+            write_all(out, b"\n".join(batch))
+            batch, size = [], 0
+    if batch:
+        batch.append(b"")
+        write_all(out, b"\n".join(batch))
+
+
+def _parse(args: list[str]) -> tuple[Options, list[str]]:
+    flags = {"b": False, "n": False, "r": False, "u": False}
+    key = budget = None
+    files = []
+    it = iter(args)
+    for arg in it:
+        if len(arg) < 2 or not arg.startswith("-"):
+            files.append(arg)
+            continue
+        for i, flag in enumerate(arg[1:], 2):
+            if flag in flags:
+                flags[flag] = True
+                continue
+            if flag not in "kS":
+                raise ValueError(f"sort: invalid option -- '{flag}'")
+            value = arg[i:] or next(it, None)
+            if value is None:
+                raise ValueError(f"sort: option requires an argument -- '{flag}'")
+            if flag == "k":
+                key = value
+            else:
+                budget = _size(value)
+            break
+    numeric, reverse, blanks = flags["n"], flags["r"], flags["b"]
+    if key is not None:
+        # options given after -k still apply to it
+        key = _key(key, numeric, reverse, blanks)
+    options = Options(numeric, reverse, flags["u"], blanks, key, budget)
+    return options, files
+
+
+def _key(value: str, numeric: bool, reverse: bool, blanks: bool) -> Key:
+    """Key of a -k value, which takes global options unless it has letters."""
+    match = _KEY.fullmatch(value)
+    if match is None:
+        raise ValueError(f"sort: invalid field specification '{value}'")
+    start, start_char, start_letters, end, end_char, end_letters = match.groups()
+    # fields and the first character count from 1, a last character of 0
+    # stands for the end of its field
+    if not int(start) or int(start_char or 1) == 0 or int(end or 1) == 0:
+        raise ValueError(f"sort: invalid field specification '{value}'")
+    end_letters = end_letters or ""
+    skip_start = skip_end = blanks
+    letters = start_letters + end_letters
+    if letters:
+        numeric, reverse = "n" in letters, "r" in letters
+        skip_start, skip_end = "b" in start_letters, "b" in end_letters
+    return Key(
+        int(start),
+        int(start_char or 1),
+        int(end) if end is not None else None,
+        int(end_char or 0),
+        skip_start,
+        skip_end,
+        numeric,
+        reverse,
+    )
+
+
+def _size(value: str) -> int:
+    # plain numbers are in kibibytes, like in GNU sort
+    unit = _UNITS.get(value[-1:], None)
+    number = value[:-1] if unit else value
+    if not number.isdigit() or not int(number):
+        raise ValueError(f"sort: invalid buffer size '{value}'")
+    return int(number) * (unit or _UNITS["K"])
@@ -0,0 +1,65 @@
+from collections import deque
+from io import IOBase
+
+from ..common import Builtin
+from ..streams import byte_output, line_blocks, write_all
+from .head import parse_count
+
+
+class Tail(Builtin):
+    streaming = binary_safe = pure = True
+
+    def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
+        value, files = parse_count(self.args, "tail", "10")
+        # `-n +N` starts at line N instead of counting from the end
+        if value.startswith("+"):
+            read, count = skip, int(value) - 1
+        else:
+            read, count = tail, int(value)
+        out = byte_output(stdout)
+        if not files:
+            read(stdin, out, count)
+        for i, arg in enumerate(files):
+            if len(files) > 1:
+                header = ("\n" if i else "") + f"==> {arg} <==\n"
+                write_all(out, header.encode())
+            with open(arg, "rb", buffering=0) as f:
+                read(f, out, count)
+        out.flush()
+
+
+def tail(f: IOBase, out: IOBase, count: int) -> None:
+    """Write last count lines of f to out, keeping only them in memory."""
+    if count <= 0:
+        return
+    ring: deque[bytes] = deque(maxlen=count)
+    for block in line_blocks(f):
+        # only the lines that can still be among the last ones are split
+        start = len(block) - block.endswith(b"\n")
+        for _ in range(count):
+            start = block.rfind(b"\n", 0, start)
+            if start < 0:
+                break
+        lines = block[start + 1 :].split(b"\n")
+        last = lines.pop()
+        ring.extend(line + b"\n" for line in lines)
+        if last:
+            ring.append(last)
+    for line in ring:
+        write_all(out, line)
+
+
+def skip(f: IOBase, out: IOBase, count: int) -> None:
+    """Copy f to out without its first count lines."""
+    for block in line_blocks(f):
+        if count > 0:
+            lines = block.count(b"\n")
+            if lines < count:
+                count -= lines
+                continue
+            start = -1
+            for _ in range(count):
+                start = block.index(b"\n", start + 1)
+            block = block[start + 1 :]
+            count = 0
+        write_all(out, block)
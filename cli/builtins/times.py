@@ -0,0 +1,19 @@
+import os
+from io import IOBase
+
+from ..common import Builtin
+
+
+class Times(Builtin):
+    def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
+        t = os.times()
+        stdout.write(f"{_minutes(t.user)} {_minutes(t.system)}\n")
+        stdout.write(f"{_minutes(t.children_user)} {_minutes(t.children_system)}\n")
+        profiler = getattr(self.shell, "profiler", None)
+        if profiler is not None:
+            stdout.write(profiler.summary())
+
+
+def _minutes(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(minutes)}m{seconds:.3f}s"
@@ -0,0 +1,24 @@
+from io import IOBase
+from typing import Optional
+
+from ..common import Builtin
+
+
+class Wait(Builtin):
+    def execute(
+        self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase
+    ) -> Optional[int]:
+        shell = self.shell
+        if shell is None:
+            return None
+        if not self.args:
+            return shell.wait()
+        status = 0
+        for arg in self.args:
+            job_id = arg[1:] if arg.startswith("%") else arg
+            if not job_id.isdigit() or int(job_id) not in shell.jobs:
+                stderr.write(f"wait: {arg}: no such job\n")
+                status = 127
+                continue
+            status = shell.wait(int(job_id))
+        return status
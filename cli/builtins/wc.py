@@ -1,21 +1,151 @@
+import mmap
+import os
+import stat
 from io import IOBase
+from itertools import repeat
+from typing import Iterable, Optional
 
-from ..common import Command
+from ..common import Builtin
+from ..streams import BUFSIZE, chunks, write_text
+from ..workers import processes
 
+# maps whitespace to b" " and everything else to b"x",
+# so that every word start becomes b" x" after translation
+_WORDS = bytes(0x20 if c in b" \t\n\v\f\r" else 0x78 for c in range(256))
+
+# lines, words, bytes, starts inside a word, ends inside a word
+Tally = tuple[int, int, int, bool, bool]
+
+
+class Wc(Builtin):
+    streaming = binary_safe = pure = True
+
+    # files are counted on a process pool when together they are at least
+    # this large, each file split in segments of at most `segment` bytes
+    parallel_threshold: int = 256 << 20
+    segment: int = 64 << 20
 
-class Wc(Command):
     def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
-        if not self.args:
-            stdout.write(self._count(stdin))
+        flags, files = _parse(self.args)
+        if not files:
+            write_text(stdout, _format(count(stdin, *flags), flags))
             return
-        for arg in self.args:
-            with open(arg, "r") as f:
-                stdout.write(self._count(f))
-
-    def _count(self, f):
-        lines, words, byts = 0, 0, 0
-        for line in f:
-            lines += 1
-            words += len(line.split(" "))
-            byts = len(line)
-        return f"{lines} {words} {byts}"
+        sizes = [_regular_size(arg) for arg in files]
+        if None not in sizes and sum(sizes) >= self.parallel_threshold:
+            results = self._count_parallel(files, sizes, flags)
+        else:
+            results = []
+            for arg in files:
+                with open(arg, "rb", buffering=0) as f:
+                    results.append(count(f, *flags))
+        write_text(stdout, "\n".join(_format(res, flags) for res in results))
+
+    def _count_parallel(
+        self, files: list[str], sizes: list[int], flags: tuple[bool, bool, bool]
+    ) -> list[tuple[int, int, int]]:
+        paths, starts, ends = [], [], []
+        for path, size in zip(files, sizes):
+            for start in range(0, max(size, 1), self.segment):
+                paths.append(path)
+                starts.append(start)
+                ends.append(min(start + self.segment, size))
+
+        # map keeps argument order, segments of one file are merged as they come
+        results: list[tuple[int, int, int]] = []
+        current: Optional[Tally] = None
+        tallies = processes().map(
+            _count_range, paths, starts, ends, repeat(flags[0]), repeat(flags[1])
+        )
+        for start, tally in zip(starts, tallies):
+            if start == 0 and current is not None:
+                results.append(current[:3])
+                current = None
+            current = tally if current is None else _merge(current, tally)
+        results.append(current[:3])
+        return results
+
+
+def count(
+    f: IOBase, lines: bool = True, words: bool = True, byts: bool = True
+) -> tuple[int, int, int]:
+    """
+    Count lines, words and bytes in f, reading it in fixed-size chunks.
+
+    Counters that were not asked for are left at zero.
+
+    """
+    return _tally(chunks(f), lines, words)[:3]
+
+
+def _tally(chunks: Iterable[bytes], lines: bool, words: bool) -> Tally:
+    nlines, nwords, nbytes = 0, 0, 0
+    first, inword = None, False
+    for chunk in chunks:
+        if not chunk:
+            continue
+        nbytes += len(chunk)
+        if lines:
+            nlines += chunk.count(b"\n")
+        if words:
+            classes = chunk.translate(_WORDS)
+            nwords += classes.count(b" x")
+            # word continued from the previous chunk was already counted
+            if not inword and classes[0] == 0x78:
+                nwords += 1
+            if first is None:
+                first = classes[0] == 0x78
+            inword = classes[-1] == 0x78
+    return nlines, nwords, nbytes, bool(first), inword
+
+
+def _merge(a: Tally, b: Tally) -> Tally:
+    """Tally of two adjacent byte ranges."""
+    joined = a[4] and b[3]
+    return (
+        a[0] + b[0],
+        a[1] + b[1] - joined,
+        a[2] + b[2],
+        a[3] if a[2] else b[3],
+        b[4] if b[2] else a[4],
+    )
+
+
+def _count_range(path: str, start: int, end: int, lines: bool, words: bool) -> Tally:
+    if start >= end:
+        return 0, 0, 0, False, False
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            chunks = (
+                mm[pos : min(pos + BUFSIZE, end)] for pos in range(start, end, BUFSIZE)
+            )
+            return _tally(chunks, lines, words)
+
+
+def _regular_size(path: str) -> Optional[int]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size if stat.S_ISREG(st.st_mode) else None
+
+
+def _parse(args: list[str]) -> tuple[tuple[bool, bool, bool], list[str]]:
+    selected = ""
+    files = []
+    for arg in args:
+        if len(arg) > 1 and arg.startswith("-"):
+            unknown = set(arg[1:]) - set("lwc")
+            if unknown:
+                raise ValueError(f"wc: invalid option -- '{unknown.pop()}'")
+            selected += arg[1:]
+            continue
+        files.append(arg)
+    if not selected:
+        return (True, True, True), files
+    return ("l" in selected, "w" in selected, "c" in selected), files
+
+
+def _format(counts: tuple[int, int, int], flags: tuple[bool, bool, bool]) -> str:
+    return " ".join(str(n) for n, on in zip(counts, flags) if on)
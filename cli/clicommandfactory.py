@@ -1,13 +1,23 @@
-import os
-from collections import Callable
-from typing import TypeVar
+from collections.abc import Callable, Iterable
+from typing import Optional, TypeVar
 
-from .builtins import Cat, Echo, Eq, Exit, Pwd, Wc
-from .common import Command
+from .builtins import lookup
+from .common import Command, Redirect
 from .parser import CommandFactory
 
 T = TypeVar("T")
 
+# redirection token -> descriptor and mode its file is opened with
+_REDIRECTS = {
+    "<": (0, "r"),
+    ">": (1, "w"),
+    ">>": (1, "a"),
+    "2>": (2, "w"),
+    "2>>": (2, "a"),
+}
+# tokens that end a word, the rest is part of one
+_BREAKS = frozenset([" ", "|", ";", "&&", "&", *_REDIRECTS])
+
 
 class CliCommandFactory(CommandFactory):
     def pipeline(self, tokens: list[str]) -> list[Command]:
@@ -20,86 +30,104 @@ class CliCommandFactory(CommandFactory):
         [Echo('echo', ['hello', 'world'], 0, 1, 2)]
 
         """
-        pipes: list[list[str]] = _splitat(tokens, lambda x: x == "|")
-
-        # delete repeating spaces
-        noreps: list[list[str]] = []
-        for pipe in pipes:
-            if not pipe:
+        # single pass: tokens are collected into a word until a space or '|',
+        # words into argv until '|' or the end of the line
+        commands: list[Command] = []
+        argv: list[str] = []
+        word: list[str] = []
+        redirects: list[Redirect] = []
+        # redirection the next word names the file of
+        target: Optional[str] = None
+        # stage may have words and still no argv if they all were malformed
+        empty: bool = True
+        # reported only when the line has no empty pipes, like it always was
+        invalid: bool = False
+        for token in tokens:
+            if token not in _BREAKS:
+                word.append(token)
+                continue
+            if word:
+                if target is None:
+                    invalid |= _push_word(argv, word)
+                else:
+                    redirects.append(_redirect(target, word))
+                    target = None
+                word.clear()
+                empty = False
+            if token == " ":
+                continue
+            if target is not None:
+                raise SyntaxError(f"Missing file name after '{target}'")
+            if token in _REDIRECTS:
+                target = token
+                continue
+            if token != "|":
+                raise SyntaxError(f"Unexpected '{token}'")
+            if empty:
                 raise SyntaxError("Empty pipe")
-            noreps.append(_del_conseq(pipe, lambda x: x == " "))
-        # at this point, there're sequences of tokens with once whitespace token between
-
-        # delete whitespace at beginning and end
-        clean: list[list[str]] = []
-        for pipe in noreps:
-            if pipe and pipe[0] == " ":
-                pipe = pipe[1:]
-            if pipe and pipe[-1] == " ":
-                pipe = pipe[:-1]
-            if not pipe:
-                raise SyntaxError("Empty pipe")
-            clean.append(pipe)
-
-        # separate words
-        pipeswords: list[list[list[str]]] = [
-            _splitat(pipe, lambda x: x == " ") for pipe in clean
-        ]
-
-        # reorder ['a', '=', 'b'] -> ['=', 'a', 'b']
-        # get rid of quotes
-        # concatenate sequences
-        commands: list[list[str]] = []
-        for pipe in pipeswords:
-            seqs: list[str] = []
-            for i, cmd in enumerate(pipe):
-                if len(cmd) > 1 and cmd[1] == "=":
-                    if len(cmd) == 3:
-                        seqs.append(cmd[1])
-                        seqs.append(_remove_quotes_if_needed(cmd[0]))
-                        seqs.append(_remove_quotes_if_needed(cmd[2]))
-                        continue
-                    raise SyntaxError("Invalid syntax '='")
-                seqs.append("".join(_remove_quotes_if_needed(seq) for seq in cmd))
-            commands.append(seqs)
-
-        if len(commands) == 1:
-            return [create_command(commands[0])]
-
-        res: list[Command] = []
-        for p in commands:
-            assert len(p) > 0
-            res.append(create_command(p))
-
-        # pipeline file descriptors
-        for pr, nxt in zip(res[:-1], res[1:]):
-            fds = os.pipe()
-            nxt.infd = fds[0]
-            pr.outfd = fds[1]
-        return res
-
-
-def create_command(argv: list[str]) -> Command:
-    assert len(argv) > 0
+            if argv or redirects:
+                commands.append(create_command(argv, redirects))
+            argv, redirects, empty = [], [], True
+        if word:
+            if target is None:
+                invalid |= _push_word(argv, word)
+            else:
+                redirects.append(_redirect(target, word))
+                target = None
+            empty = False
+        if target is not None:
+            raise SyntaxError(f"Missing file name after '{target}'")
+        if empty:
+            raise SyntaxError("Empty pipe")
+        if argv or redirects:
+            commands.append(create_command(argv, redirects))
+
+        if invalid:
+            raise SyntaxError("Invalid syntax '='")
+        # pipes between stages are created by the executor when it runs them
+        return commands
+
+
+def _push_word(argv: list[str], word: list[str]) -> bool:
+    """
+    Append word made of tokens to argv, return True if it is malformed.
+
+    Assignment ['a', '=', 'b'] is reordered into '=', 'a', 'b',
+    every other word has its tokens unquoted and concatenated.
+
+    """
+    if len(word) > 1 and word[1] == "=":
+        if len(word) != 3:
+            return True
+        argv.append("=")
+        argv.append(_remove_quotes_if_needed(word[0]))
+        argv.append(_remove_quotes_if_needed(word[2]))
+        return False
+    if len(word) == 1:
+        argv.append(_remove_quotes_if_needed(word[0]))
+    else:
+        argv.append("".join(_remove_quotes_if_needed(token) for token in word))
+    return False
+
+
+def create_command(argv: list[str], redirects: Iterable[Redirect] = ()) -> Command:
+    if not argv:
+        raise SyntaxError("Redirection without a command")
     name: str = argv[0]
     if len(argv) > 1:
         args = argv[1:]
     else:
         args = []
 
-    if name == "echo":
-        return Echo(name, args)
-    if name == "wc":
-        return Wc(name, args)
-    if name == "exit":
-        return Exit(name, args)
-    if name == "cat":
-        return Cat(name, args)
-    if name == "=":
-        return Eq(name, args)
-    if name == "pwd":
-        return Pwd(name, args)
-    return Command(name, args)
+    builtin = lookup(name)
+    if builtin is not None:
+        return builtin(name, args, redirects=tuple(redirects))
+    return Command(name, args, redirects=tuple(redirects))
+
+
+def _redirect(token: str, word: list[str]) -> Redirect:
+    fd, mode = _REDIRECTS[token]
+    return Redirect(fd, "".join(_remove_quotes_if_needed(t) for t in word), mode)
 
 
 def _remove_quotes_if_needed(token: str) -> str:
@@ -112,30 +140,3 @@ def _remove_balanced(lst: list[T], pred: Callable[[T, T], bool]) -> list[T]:
     if pred(lst[0], lst[-1]):
         return lst[1:-1]
     return lst
-
-
-def _splitat(lst: list[T], pred: Callable[[T], bool]) -> list[list[T]]:
-    pipes = []
-    last = 0
-    i = len(lst)
-    for i, token in enumerate(lst):
-        if pred(token):
-            pipes.append(lst[last:i])
-            last = i + 1
-    pipes.append(lst[last : i + 1])
-    return pipes
-
-
-def _del_conseq(lst: list[T], pred: Callable[[T], bool]) -> list[T]:
-    if not lst:
-        return lst
-    nor: list[str] = []
-    for i, token in enumerate(lst[:-1]):
-        if pred(token) and pred(lst[i + 1]):
-            continue
-        if pred(token) and not pred(lst[i + 1]):
-            nor.append(token)
-        if not pred(token):
-            nor.append(token)
-    nor.append(lst[-1])
-    return nor
@@ -1,8 +1,28 @@
-import collections
-import itertools
+import re
 
 from .parser import Lexer
 
+# Every character of a line starts exactly one of these alternatives, so a
+# single `finditer` walks the whole line. A word only ends at a special
+# character, a '"' in the middle of a word does not start a quoted string.
+# '2>' is only special at the start of a word, like in other shells.
+_TOKEN = re.compile(
+    r"""
+    (?P<squote>'[^']*')
+    |(?P<dquote>"[^"]*")
+    |(?P<special>&&|2(?<![^ |;&<>]2)>>?|>>|[ |=;&<>])
+    |(?P<variable>\$[^ $|'=;&<>]*)
+    |(?P<word>[^ $|'=;&<>"][^ $|'=;&<>]*)
+    |(?P<unbalanced>['"])
+    """,
+    re.VERBOSE,
+)
+# inside double quotes, where '"' can only be the closing quote
+_VARIABLE = re.compile(r"\$([^ $|'=;&<>\"]*)")
+_QUOTE = re.compile(r"['\"]")
+_REFERENCE = re.compile(r"\$([^ $|'=;&<>]*)")
+_SEPARATORS = frozenset([";", "&&", "&"])
+
 
 class CliLexer(Lexer):
     def __init__(self, env: dict):
@@ -18,75 +38,89 @@ class CliLexer(Lexer):
         ['echo', ' ', 'hello', ' ', 'wo', 'rld']
 
         """
-        self._validate(raw)
-        return self._tokenize(raw)
-
-    def _validate(self, raw: str):
-        copy = []
-        for char in raw:
-            if char in ['"', "'"]:
-                copy.append(char)
-        quotes = "".join(copy)
-
-        itr = iter(quotes)
-        try:
-            for char in itr:
-                c = next(itr)
-                while c != char:
-                    c = next(itr)
-        except StopIteration:
+        env = self.env
+        tokens: list[str] = []
+        append = tokens.append
+        # '"' inside a word still has to be paired with another one
+        stray = False
+        for match in _TOKEN.finditer(raw):
+            kind = match.lastgroup
+            token = match.group()
+            if kind == "word":
+                append(token)
+                stray = stray or '"' in token
+            elif kind == "special" or kind == "squote":
+                append(token)
+            elif kind == "variable":
+                value = env.get(token[1:], "")
+                if value:
+                    append(value)
+                stray = stray or '"' in token
+            elif kind == "dquote":
+                if "$" in token:
+                    token = _VARIABLE.sub(lambda m: env.get(m.group(1), ""), token)
+                append(token)
+            else:
+                raise SyntaxError("Unbalanced quotes")
+        if stray and not _balanced(raw):
             raise SyntaxError("Unbalanced quotes")
+        return tokens
 
-    def _tokenize(self, raw: str, inner=False, expand=True) -> list[str]:
-        # assume all quotes are balanced
-        tokens = []
-        iterator = iter(enumerate(raw))
-        for i, char in iterator:
-            if char in ['"', "'"]:
-                if inner:
-                    tokens.append(char)
-                    continue
-                end = raw.find(char, i + 1)
-                substr = raw[i + 1 : end if end != -1 else None]
-                if char == "'":
-                    word = "".join(self._tokenize(substr, inner=True, expand=False))
-                if char == '"':
-                    # substring guaranteed not to have '"'
-                    # recursion depth is at most 1
-                    word = "".join(self._tokenize(substr, inner=True, expand=expand))
-                tokens.append(char + word + char)
-                _consume(iterator, end - i)
-                continue
-            # no quote will ever be processed below
-            if char in [" ", "|", "="]:
-                tokens.append(char)
+    def split(self, raw: str) -> list[tuple[str, str]]:
+        """
+        Examples
+        ----------
+        >>> from cli.clilexer import CliLexer
+        >>> CliLexer({}).split("a=1; echo $a &")
+        [('a=1', ';'), (' echo $a ', '&')]
+
+        """
+        if ";" not in raw and "&" not in raw:
+            return [(raw, ";")]
+        parts: list[tuple[str, str]] = []
+        start = 0
+        for match in _TOKEN.finditer(raw):
+            separator = match.group()
+            if match.lastgroup != "special" or separator not in _SEPARATORS:
                 continue
-            end = _nextspecialchar(raw, i + 1)
-            if char == "$" and expand:
-                word = raw[i + 1 : end]
-                tokens.append(self.env.get(word, ""))
-            else:
-                word = raw[i:end]
-                tokens.append(word)
-            _consume(iterator, end - i - 1)
-        # delete empty strings
-        tokens = list(filter(None, tokens))
-        return tokens
+            source = raw[start : match.start()]
+            if not source.strip(" "):
+                raise SyntaxError(f"Unexpected '{separator}'")
+            parts.append((source, separator))
+            start = match.end()
+        rest = raw[start:]
+        if not parts or rest.strip(" "):
+            # line without separators is parsed as it always was
+            parts.append((rest, ";"))
+        elif parts[-1][1] == "&&":
+            raise SyntaxError("Unexpected end of line after '&&'")
+        return parts
+
+
+def _balanced(raw: str) -> bool:
+    """Check that every quote is closed by the same quote, skipping the others."""
+    opened = None
+    for match in _QUOTE.finditer(raw):
+        quote = match.group()
+        if opened is None:
+            opened = quote
+        elif quote == opened:
+            opened = None
+    return opened is None
 
 
-# https://stackoverflow.com/a/1474848
-def _consume(iterator, n):
-    """Advance the iterator n-steps ahead. If n is none, consume entirely."""
-    if n == -1:
-        n = None
-    collections.deque(itertools.islice(iterator, n), maxlen=0)
+def references(raw: str) -> list[str]:
+    """
+    Names of all variables raw may expand, without repetitions.
 
+    Names are collected without regard to quoting, so the list may also
+    contain names that are never expanded.
 
-def _nextspecialchar(string: str, start: int):
-    next_sp = end if (end := string.find(" ", start)) != -1 else len(string)
-    next_dl = end if (end := string.find("$", start)) != -1 else len(string)
-    next_p = end if (end := string.find("|", start)) != -1 else len(string)
-    next_s = end if (end := string.find("'", start)) != -1 else len(string)
-    next_d = end if (end := string.find('"', start)) != -1 else len(string)
-    next_d = end if (end := string.find("=", start)) != -1 else len(string)
-    return min(next_sp, next_dl, next_p, next_s, next_d)
+    """
+    names = {}
+    for name in _REFERENCE.findall(raw):
+        names[name] = None
+        # inside double quotes a name also ends at '"'
+        if '"' in name:
+            names[name[: name.index('"')]] = None
+    return list(names)
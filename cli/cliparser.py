@@ -1,16 +1,43 @@
+from collections import OrderedDict
+from typing import NamedTuple
+
+from . import builtins
 from .clicommandfactory import CliCommandFactory
-from .clilexer import CliLexer
+from .clilexer import CliLexer, references
 from .common import Command
 from .parser import CommandFactory, Lexer, Parser
+from .plan import Plan, compile_plan
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
 
 
 class CliParser(Parser):
-    def __init__(self, env: dict = None):
-        if not env:
+    def __init__(self, env: dict = None, cache_size: int = 256):
+        """
+        Parameters
+        ----------
+        env : dict
+            Dictionary with environment variables used for expansion.
+
+        cache_size : int
+            Number of parsed pipelines to remember, 0 disables caching.
+
+        """
+        if env is None:
             env = dict()
         self.env = env
         self.lexer: Lexer = CliLexer(env)
         self.commandFactory: CommandFactory = CliCommandFactory()
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple, list[Command]] = OrderedDict()
+        self._hits = self._misses = self._evictions = 0
+        self._generation = builtins.generation()
 
     def parse(self, raw: str) -> list[Command]:
         """
@@ -22,4 +49,76 @@ class CliParser(Parser):
         [Echo('echo', ['hello', 'world'], 0, 1, 2)]
 
         """
+        parts = self.split(raw)
+        if len(parts) > 1 or parts[0][1] != ";":
+            raise SyntaxError("Expected a single pipeline")
+        return self._pipeline(parts[0][0])
+
+    def split(self, raw: str) -> list[tuple[str, str]]:
+        """
+        Examples
+        ----------
+        >>> from cli.cliparser import CliParser
+        >>> CliParser().split("a=1 && echo $a")
+        [('a=1 ', '&&'), (' echo $a', ';')]
+
+        """
+        return self.lexer.split(raw)
+
+    def bind(self, env: dict) -> "CliParser":
+        return CliParser(env, self.cache_size)
+
+    def compile(self, raw: str) -> Plan:
+        """
+        Examples
+        ----------
+        >>> from cli.cliparser import CliParser
+        >>> plan = CliParser().compile("echo hello $a")
+        >>> plan.commands({"a": "world"})
+        [Echo('echo', ['hello', 'world'], 0, 1, 2)]
+
+        """
+        return compile_plan(raw)
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(
+            self._hits, self._misses, self._evictions, self.cache_size, len(self._cache)
+        )
+
+    def cache_clear(self) -> None:
+        self._cache.clear()
+        self._hits = self._misses = self._evictions = 0
+
+    def _pipeline(self, raw: str) -> list[Command]:
+        """Commands of one pipeline, expanded now, from the cache if possible."""
+        if not self.cache_size:
+            return self._parse(raw)
+        if self._generation != builtins.generation():
+            # cached pipelines are bound to builtins that may be replaced now
+            self._cache.clear()
+            self._generation = builtins.generation()
+
+        key = (raw, tuple(self.env.get(name) for name in references(raw)))
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._hits += 1
+            self._cache.move_to_end(key)
+            return _fresh(cached)
+
+        self._misses += 1
+        pipeline = self._parse(raw)
+        self._cache[key] = _fresh(pipeline)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+            self._evictions += 1
+        return pipeline
+
+    def _parse(self, raw: str) -> list[Command]:
         return self.commandFactory.pipeline(self.lexer.tokenize(raw))
+
+
+def _fresh(pipeline: list[Command]) -> list[Command]:
+    """Copy of pipeline that shares no mutable state with it."""
+    return [
+        type(cmd)(cmd.name, list(cmd.args), redirects=cmd.redirects) for cmd in pipeline
+    ]
@@ -1,32 +1,117 @@
-import subprocess as sp
 from io import IOBase
+from typing import NamedTuple, Optional
+
+from .pathcache import path_cache
+
+
+class Redirect(NamedTuple):
+    # standard descriptor of the command the file is installed as
+    fd: int
+    path: str
+    # `open` mode: "r" for '<', "w" for '>' and '2>', "a" for '>>' and '2>>'
+    mode: str
 
 
 class Command:
     def __init__(
-        self, name: str, args: list[str], infd: int = 0, outfd: int = 1, errfd: int = 2
+        self,
+        name: str,
+        args: list[str],
+        infd: int = 0,
+        outfd: int = 1,
+        errfd: int = 2,
+        redirects: tuple[Redirect, ...] = (),
     ):
         self.name = name
         self.args = args
         self.infd = infd
         self.outfd = outfd
         self.errfd = errfd
+        # files opened by the executor, in order, a later one for the same
+        # descriptor replaces the earlier
+        self.redirects = redirects
 
-    def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
-        process = sp.Popen(
-            [self.name] + self.args,
-            stdin=stdin,
-            stdout=stdout,
-            stderr=stderr,
-            env=env,
-        )
-        process.wait()
+    def start(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase):
+        """
+        Start command without waiting for it to finish.
+
+        Returns
+        ----------
+        out : SpawnedProcess or subprocess.Popen
+            Running process, caller is responsible for waiting on it.
+
+        """
+        for stream in (stdout, stderr):
+            if hasattr(stream, "flush"):
+                stream.flush()
+        # subprocess is only imported once something has to be spawned
+        from .spawn import spawn
+
+        executable = path_cache.lookup(self.name, env)
+        argv = [self.name] + self.args
+        try:
+            return spawn(argv, executable, env, stdin, stdout, stderr)
+        except FileNotFoundError:
+            if executable is None:
+                raise
+            # cached executable was removed, search again
+            path_cache.forget(self.name)
+            executable = path_cache.lookup(self.name, env)
+            return spawn(argv, executable, env, stdin, stdout, stderr)
+
+    def execute(
+        self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase
+    ) -> Optional[int]:
+        """
+        Run command to completion.
+
+        Returns
+        ----------
+        out : int or None
+            Exit status, builtins return None when they succeed.
+
+        """
+        return self.start(env, stdin, stdout, stderr).wait()
 
     def __str__(self):
+        redirects = f", {self.redirects}" if self.redirects else ""
         return (
             f"{self.__class__.__name__}"
-            f"('{self.name}', {self.args}, {self.infd}, {self.outfd}, {self.errfd})"
+            f"('{self.name}', {self.args}, {self.infd}, {self.outfd}, {self.errfd}"
+            f"{redirects})"
         )
 
     def __repr__(self):
         return self.__str__()
+
+
+class Builtin(Command):
+    """
+    Command implemented inside the interpreter.
+
+    Builtins are run on worker threads when they are a part of a pipeline,
+    so `execute` must only touch streams and environment it was given.
+
+    Class attributes declare what the executor may rely on:
+
+    streaming
+        Input is consumed in chunks as it arrives, memory use does not
+        grow with its size.
+    binary_safe
+        `execute` also works when stdin and stdout are binary streams, so
+        fused stages can skip text wrappers.
+    pure
+        Nothing but the output is affected, several instances may safely
+        run at the same time.
+
+    """
+
+    streaming: bool = False
+    binary_safe: bool = False
+    pure: bool = False
+
+    # shell running the command, set by the executor before it is run
+    shell = None
+
+    def execute(self, env: dict, stdin: IOBase, stdout: IOBase, stderr: IOBase) -> None:
+        raise NotImplementedError("")
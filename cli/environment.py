@@ -0,0 +1,119 @@
+import os
+import threading
+from collections.abc import Mapping, MutableMapping
+from typing import Iterator, Optional
+
+
+class Environment(MutableMapping):
+    """
+    Shell variables that keep an encoded copy ready for spawning processes.
+
+    Building the environment of a child means encoding every variable,
+    which costs more than the spawn itself once there are a few hundred of
+    them. `encoded` returns a mapping of bytes that is made once and then
+    only patched with the variables assigned or removed since, every change
+    bumps `version`. Snapshots are never changed after they were returned,
+    so a process can be spawned from one while another thread assigns.
+
+    `copy` is copy-on-write: the copy shares variables and encoded snapshot
+    with the original until one of them assigns, from then on each has its
+    own, like after `dict.copy`.
+
+    """
+
+    def __init__(self, variables: Optional[Mapping] = None):
+        self._vars: dict[str, str] = dict(variables or {})
+        self.version = 0
+        self._lock = threading.Lock()
+        self._encoded: Optional[dict[bytes, bytes]] = None
+        self._encoded_version = -1
+        # names assigned or removed since _encoded was made
+        self._changed: set[str] = set()
+        # _vars is used by a copy as well and is copied before it changes
+        self._shared = False
+
+    def copy(self) -> "Environment":
+        twin = Environment()
+        with self._lock:
+            twin._vars = self._vars
+            twin.version = self.version
+            twin._encoded = self._encoded
+            twin._encoded_version = self._encoded_version
+            twin._changed = set(self._changed)
+            twin._shared = self._shared = True
+        return twin
+
+    def overlay(self, variables: Optional[Mapping] = None) -> "Environment":
+        """Copy with variables assigned on top, for a single job or command."""
+        env = self.copy()
+        if variables:
+            env.update(variables)
+        return env
+
+    def encoded(self) -> Mapping[bytes, bytes]:
+        """Variables encoded like os.environb, for posix_spawn and Popen."""
+        if self._encoded_version == self.version:
+            return self._encoded
+        with self._lock:
+            if self._encoded is None:
+                snapshot = {
+                    os.fsencode(name): os.fsencode(value)
+                    for name, value in self._vars.items()
+                }
+            else:
+                snapshot = dict(self._encoded)
+                for name in self._changed:
+                    value = self._vars.get(name)
+                    if value is None:
+                        snapshot.pop(os.fsencode(name), None)
+                    else:
+                        snapshot[os.fsencode(name)] = os.fsencode(value)
+            self._changed.clear()
+            self._encoded, self._encoded_version = snapshot, self.version
+        return snapshot
+
+    def get(self, name: str, default=None):
+        return self._vars.get(name, default)
+
+    def __getitem__(self, name: str) -> str:
+        return self._vars[name]
+
+    def __setitem__(self, name: str, value: str) -> None:
+        with self._lock:
+            self._own()[name] = value
+            self._changed.add(name)
+            self.version += 1
+
+    def __delitem__(self, name: str) -> None:
+        with self._lock:
+            if name not in self._vars:
+                raise KeyError(name)
+            del self._own()[name]
+            self._changed.add(name)
+            self.version += 1
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._vars
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._vars)
+
+    def __len__(self) -> int:
+        return len(self._vars)
+
+    def __repr__(self) -> str:
+        return f"Environment({self._vars!r})"
+
+    def _own(self) -> dict[str, str]:
+        """Variables this environment may change, copied if they are shared."""
+        if self._shared:
+            self._vars = dict(self._vars)
+            self._shared = False
+        return self._vars
+
+
+def environ(env: Mapping) -> Mapping:
+    """Environment to hand to posix_spawn or Popen for env."""
+    if isinstance(env, Environment) and os.name == "posix":
+        return env.encoded()
+    return env
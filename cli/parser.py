@@ -19,6 +19,24 @@ class Lexer:
         """
         raise NotImplementedError("")
 
+    def split(self, raw: str) -> list[tuple[str, str]]:
+        """
+        Split raw at ';', '&&' and '&' without expanding anything.
+
+        Parameters
+        ----------
+        raw : str
+            String to be split.
+
+        Returns
+        ----------
+        out : list[tuple[str, str]]
+            Source of every pipeline with the separator that ends it,
+            by default raw is a single pipeline.
+
+        """
+        return [(raw, ";")]
+
 
 class CommandFactory:
     def pipeline(self, tokens: list[str]) -> list[Command]:
@@ -56,3 +74,55 @@ class Parser:
             List of Commands.
         """
         raise NotImplementedError("")
+
+    def split(self, raw: str) -> list[tuple[str, str]]:
+        """
+        Split a string that may hold several pipelines, without expanding
+        variables, so that each is parsed right before it runs.
+
+        Parameters
+        ----------
+        raw : str
+            String to be split.
+
+        Returns
+        ----------
+        out : list[tuple[str, str]]
+            Source of every pipeline, for `parse`, with the separator
+            that ends it: ";" or "&&" to run it in the foreground, "&"
+            to run it in the background.
+        """
+        return [(raw, ";")]
+
+    def bind(self, env: dict) -> "Parser":
+        """
+        Parser for a shell running with an environment of its own.
+
+        Parameters
+        ----------
+        env : dict
+            Variables the returned parser expands.
+
+        Returns
+        ----------
+        out : Parser
+            Parser expanding variables from env, this one by default.
+        """
+        return self
+
+    def compile(self, raw: str):
+        """
+        Prepare a string to be turned into commands many times.
+
+        Parameters
+        ----------
+        raw : str
+            String to be parsed.
+
+        Returns
+        ----------
+        out
+            Immutable plan with method `commands(env)` returning a fresh
+            list of Commands for variable values from env.
+        """
+        raise NotImplementedError("")
@@ -0,0 +1,63 @@
+import os
+import threading
+from typing import Optional
+
+
+class PathCache:
+    """
+    Remembers where executables were found on PATH, like `hash` in bash.
+
+    Lookups are forgotten whenever PATH differs from the one they were made
+    with, so the table is never consulted for a stale search path.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path: Optional[str] = None
+        # name -> [absolute path, number of hits]
+        self._table: dict[str, list] = {}
+
+    def lookup(self, name: str, env: dict) -> Optional[str]:
+        """
+        Return path of executable name, or None if it should be left to exec.
+
+        Names containing a slash are never searched.
+
+        """
+        if "/" in name:
+            return None
+        path = env.get("PATH", os.defpath)
+        with self._lock:
+            if path != self._path:
+                self._table.clear()
+                self._path = path
+            entry = self._table.get(name)
+            if entry is not None:
+                entry[1] += 1
+                return entry[0]
+        import shutil
+
+        found = shutil.which(name, path=path)
+        if found is None:
+            return None
+        with self._lock:
+            if path == self._path:
+                self._table[name] = [found, 1]
+        return found
+
+    def forget(self, name: str) -> None:
+        with self._lock:
+            self._table.pop(name, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._table.clear()
+
+    def entries(self) -> list[tuple[str, str, int]]:
+        """List of (name, path, hits) in the order commands were found."""
+        with self._lock:
+            return [(name, path, hits) for name, (path, hits) in self._table.items()]
+
+
+path_cache = PathCache()
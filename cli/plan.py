@@ -0,0 +1,132 @@
+import re
+from typing import NamedTuple, Optional, Union
+
+from .clicommandfactory import CliCommandFactory, create_command
+from .clilexer import CliLexer, references
+from .common import Command, Redirect
+
+# Variables are compiled into placeholders that the lexer and the factory
+# treat as plain words, `_PLACEHOLDER` finds them in the resulting argv.
+_PLACEHOLDER = re.compile("\x00([0-9]+)\x00")
+
+# argument template, literal or parts joined at instantiation:
+# strings are copied, integers index Plan.variables
+Template = Union[str, tuple[Union[str, int], ...]]
+
+
+class Stage(NamedTuple):
+    # command class, None when the name itself comes from a variable
+    binding: Optional[type]
+    argv: tuple[Template, ...]
+    # descriptor, file name and mode of every redirection
+    redirects: tuple[tuple[int, Template, str], ...] = ()
+
+
+class Plan(NamedTuple):
+    """
+    Parsed command line with variables left unexpanded.
+
+    Instantiating a plan only substitutes variable values into prepared
+    argument templates. A value that would change the structure of the
+    line, like an empty string or '|', makes it fall back to full parsing,
+    so the result is always what parsing the line would give.
+
+    """
+
+    raw: str
+    variables: tuple[str, ...]
+    # None if the line can only be parsed with actual values
+    stages: Optional[tuple[Stage, ...]]
+
+    def commands(self, env: dict) -> list[Command]:
+        """
+        Fresh commands of the line with variables taken from env.
+
+        Examples
+        ----------
+        >>> from cli.plan import compile_plan
+        >>> plan = compile_plan("echo $a | wc")
+        >>> plan.commands({"a": "hello"})
+        [Echo('echo', ['hello'], 0, 1, 2), Wc('wc', [], 0, 1, 2)]
+
+        """
+        values = [env.get(name, "") for name in self.variables]
+        if self.stages is None or not all(map(_inert, values)):
+            return CliCommandFactory().pipeline(CliLexer(env).tokenize(self.raw))
+        commands: list[Command] = []
+        for stage in self.stages:
+            argv = [_fill(template, values) for template in stage.argv]
+            redirects = tuple(
+                Redirect(fd, _fill(path, values), mode)
+                for fd, path, mode in stage.redirects
+            )
+            if stage.binding is None:
+                commands.append(create_command(argv, redirects))
+            else:
+                commands.append(stage.binding(argv[0], argv[1:], redirects=redirects))
+        return commands
+
+
+def compile_plan(raw: str) -> Plan:
+    names = references(raw)
+    if "\x00" in raw:
+        return Plan(raw, tuple(names), None)
+    placeholders = {name: f"\x00{i}\x00" for i, name in enumerate(names)}
+    try:
+        pipeline = CliCommandFactory().pipeline(CliLexer(placeholders).tokenize(raw))
+    except SyntaxError:
+        if not names:
+            raise
+        # might still be valid once some variable turns out to be empty
+        return Plan(raw, tuple(names), None)
+
+    argvs = [[_template(arg) for arg in [cmd.name] + cmd.args] for cmd in pipeline]
+    paths = [[_template(r.path) for r in cmd.redirects] for cmd in pipeline]
+    # keep only variables that were actually expanded, in order of use
+    used: dict[int, int] = {}
+    for templates in argvs + paths:
+        for arg in templates:
+            for part in arg if isinstance(arg, tuple) else ():
+                if isinstance(part, int):
+                    used.setdefault(part, len(used))
+
+    stages = []
+    for cmd, argv, targets in zip(pipeline, argvs, paths):
+        argv = [_renumber(arg, used) for arg in argv]
+        binding = type(cmd) if isinstance(argv[0], str) else None
+        redirects = tuple(
+            (r.fd, _renumber(path, used), r.mode)
+            for r, path in zip(cmd.redirects, targets)
+        )
+        stages.append(Stage(binding, tuple(argv), redirects))
+    return Plan(raw, tuple(names[i] for i in used), tuple(stages))
+
+
+def _template(arg: str) -> Template:
+    if "\x00" not in arg:
+        return arg
+    parts = _PLACEHOLDER.split(arg)
+    # odd items are captured variable indices
+    return tuple(
+        int(part) if i % 2 else part for i, part in enumerate(parts) if i % 2 or part
+    )
+
+
+def _renumber(template: Template, used: dict[int, int]) -> Template:
+    if isinstance(template, str):
+        return template
+    return tuple(part if isinstance(part, str) else used[part] for part in template)
+
+
+def _fill(template: Template, values: list[str]) -> str:
+    if isinstance(template, str):
+        return template
+    return "".join(part if isinstance(part, str) else values[part] for part in template)
+
+
+def _inert(value: str) -> bool:
+    """Check that value expands into a single token that is only ever data."""
+    if value in ("", " ", "|", "=", ";", "&", "&&", "<", ">", ">>", "2>", "2>>"):
+        return False
+    # quotes around a token are removed when its word is built
+    return not (len(value) > 1 and value[0] == value[-1] and value[0] in "'\"")
@@ -0,0 +1,263 @@
+"""
+Opt-in instrumentation of command lines and pipeline stages.
+
+A Profiler given to a Shell records, for every line it runs, time spent
+in the lexer and in the command factory, and for every stage its wall and
+CPU time, bytes read and written and, for external commands, how long it
+took to start them. Records are appended to a file as JSON lines and
+summed up for the `times` builtin.
+
+Byte counts come from /proc and from the in-memory pipes between fused
+builtins, they are left out where /proc is not available.
+
+"""
+import json
+import os
+import threading
+import time
+from io import IOBase
+from typing import Callable, Optional
+
+from .parser import CommandFactory, Lexer
+
+# stage counters summed up per command name
+_TOTALS = ("runs", "wall", "cpu", "bytes_in", "bytes_out")
+
+
+class Profiler:
+    def __init__(self, path: Optional[str] = None):
+        """
+        Parameters
+        ----------
+        path : str, optional
+            File records are appended to, one JSON object per line.
+            Without it records are only summed up.
+
+        """
+        self.path = path
+        self._file: Optional[IOBase] = None
+        self._record: Optional[dict] = None
+        self._lock = threading.Lock()
+        self.lines = 0
+        self.parse_totals = {"parse": 0.0, "lex": 0.0, "factory": 0.0}
+        # command name -> counters named in _TOTALS
+        self.totals: dict[str, dict[str, float]] = {}
+
+    def instrument(self, parser) -> None:
+        """Time lexer and command factory of parser separately."""
+        if isinstance(getattr(parser, "lexer", None), Lexer):
+            parser.lexer = _TimedLexer(parser.lexer, self)
+        if isinstance(getattr(parser, "commandFactory", None), CommandFactory):
+            parser.commandFactory = _TimedFactory(parser.commandFactory, self)
+
+    def begin(self, line: Optional[str]) -> None:
+        self._record = {
+            "line": line,
+            "parse": 0.0,
+            "lex": 0.0,
+            "factory": 0.0,
+            "stages": [],
+            "start": time.time(),
+            "_started": time.perf_counter(),
+        }
+
+    def end(self, status: int) -> None:
+        record, self._record = self._record, None
+        if record is None:
+            return
+        record["wall"] = time.perf_counter() - record.pop("_started")
+        record["status"] = status
+        with self._lock:
+            self.lines += 1
+            for key in self.parse_totals:
+                self.parse_totals[key] += record[key]
+            for stage in record["stages"]:
+                stage.pop("_started", None)
+                totals = self.totals.setdefault(
+                    stage["name"], dict.fromkeys(_TOTALS, 0)
+                )
+                totals["runs"] += 1
+                for key in _TOTALS[1:]:
+                    totals[key] += stage[key] or 0
+        if self.path is not None:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(json.dumps(record) + "\n")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def split(self, parser, raw: str):
+        """Split raw into pipelines with parser, adding the time to the current line."""
+        started = time.perf_counter()
+        try:
+            return parser.split(raw)
+        finally:
+            self._add("parse", time.perf_counter() - started)
+
+    def parse(self, parser, raw: str):
+        """Parse a pipeline with parser, adding the time to the current line."""
+        started = time.perf_counter()
+        try:
+            return parser.parse(raw)
+        finally:
+            self._add("parse", time.perf_counter() - started)
+
+    def stage(self, name: str, builtin: bool) -> dict:
+        """Counters of a new stage of the current line."""
+        stats = {
+            "name": name,
+            "builtin": builtin,
+            "spawn": None,
+            "wall": 0.0,
+            "cpu": None,
+            "bytes_in": None,
+            "bytes_out": None,
+        }
+        if self._record is not None:
+            self._record["stages"].append(stats)
+        return stats
+
+    def call(self, stats: dict, fn: Callable, *args):
+        """Call fn, charging wall and CPU time and I/O of this thread to stats."""
+        io_before = _thread_io()
+        cpu = time.thread_time()
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            stats["wall"] += time.perf_counter() - started
+            stats["cpu"] = (stats["cpu"] or 0) + time.thread_time() - cpu
+            io_after = _proc_io("/proc/thread-self/io")
+            if io_before is not None and io_after is not None:
+                _count(stats, io_after[0] - io_before[0], io_after[1] - io_before[1])
+
+    def spawn(self, stats: dict, start: Callable, *args):
+        """Start a process with start, recording how long it took."""
+        stats["_started"] = started = time.perf_counter()
+        try:
+            return start(*args)
+        finally:
+            stats["spawn"] = time.perf_counter() - started
+
+    def wait(self, stats: dict, process) -> int:
+        """
+        Wait for process like its `wait` does, also recording its resources.
+
+        The process is reaped here, its returncode is set as if it had been
+        waited on normally.
+
+        """
+        if process.returncode is not None or not hasattr(os, "wait4"):
+            status = process.wait()
+        else:
+            if hasattr(os, "waitid"):
+                # exited but not reaped yet, so /proc still has its counters
+                os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+                counters = _proc_io(f"/proc/{process.pid}/io")
+                if counters is not None:
+                    _count(stats, *counters)
+            _, code, usage = os.wait4(process.pid, 0)
+            status = process.returncode = os.waitstatus_to_exitcode(code)
+            stats["cpu"] = usage.ru_utime + usage.ru_stime
+        stats["wall"] = time.perf_counter() - stats.pop("_started")
+        return status
+
+    def piped(self, stats: dict, bytes_in: int = 0, bytes_out: int = 0) -> None:
+        """Add bytes a stage moved through in-memory pipes."""
+        _count(stats, bytes_in, bytes_out)
+
+    def summary(self) -> str:
+        """Table of everything recorded so far, for the `times` builtin."""
+        with self._lock:
+            parse = self.parse_totals
+            rows = [
+                f"{self.lines} lines: parse {parse['parse']:.6f}s "
+                f"(lex {parse['lex']:.6f}s, factory {parse['factory']:.6f}s)",
+                f"{'command':<12}{'runs':>6}{'wall':>12}{'cpu':>12}"
+                f"{'bytes in':>14}{'bytes out':>14}",
+            ]
+            for name, totals in sorted(
+                self.totals.items(), key=lambda item: -item[1]["wall"]
+            ):
+                rows.append(
+                    f"{name:<12}{totals['runs']:>6}{totals['wall']:>11.6f}s"
+                    f"{totals['cpu']:>11.6f}s"
+                    f"{totals['bytes_in']:>14}{totals['bytes_out']:>14}"
+                )
+        return "\n".join(rows) + "\n"
+
+    def _add(self, key: str, elapsed: float) -> None:
+        if self._record is not None:
+            self._record[key] += elapsed
+
+
+class _TimedLexer(Lexer):
+    def __init__(self, lexer: Lexer, profiler: Profiler):
+        self.lexer = lexer
+        self.profiler = profiler
+
+    def tokenize(self, raw: str) -> list[str]:
+        started = time.perf_counter()
+        try:
+            return self.lexer.tokenize(raw)
+        finally:
+            self.profiler._add("lex", time.perf_counter() - started)
+
+    def split(self, raw: str) -> list[tuple[str, str]]:
+        # Lexer has a default, __getattr__ would never be asked for it
+        started = time.perf_counter()
+        try:
+            return self.lexer.split(raw)
+        finally:
+            self.profiler._add("lex", time.perf_counter() - started)
+
+    def __getattr__(self, name: str):
+        return getattr(self.lexer, name)
+
+
+class _TimedFactory(CommandFactory):
+    def __init__(self, factory: CommandFactory, profiler: Profiler):
+        self.factory = factory
+        self.profiler = profiler
+
+    def pipeline(self, tokens: list[str]):
+        started = time.perf_counter()
+        try:
+            return self.factory.pipeline(tokens)
+        finally:
+            self.profiler._add("factory", time.perf_counter() - started)
+
+    def __getattr__(self, name: str):
+        return getattr(self.factory, name)
+
+
+def _count(stats: dict, bytes_in: int, bytes_out: int) -> None:
+    stats["bytes_in"] = (stats["bytes_in"] or 0) + bytes_in
+    stats["bytes_out"] = (stats["bytes_out"] or 0) + bytes_out
+
+
+def _thread_io() -> Optional[tuple[int, int]]:
+    """Counters of the calling thread, as if the file was not read."""
+    return _proc_io("/proc/thread-self/io", own=True)
+
+
+def _proc_io(path: str, own: bool = False) -> Optional[tuple[int, int]]:
+    """
+    Bytes read and written through system calls, from a /proc io file.
+
+    With own set the file describes the calling thread, reading it is
+    counted in, so that the difference of two calls excludes the reads.
+
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        fields = dict(line.split(b": ") for line in data.splitlines())
+        read, written = int(fields[b"rchar"]), int(fields[b"wchar"])
+    except (OSError, ValueError, KeyError):
+        return None
+    # the counters do not include the read that returned them yet
+    return (read + len(data) if own else read), written
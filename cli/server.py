@@ -0,0 +1,91 @@
+import io
+import os
+import socket
+import socketserver
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .cliparser import CliParser
+from .environment import Environment
+from .shell import Shell
+
+
+class ShellServer(socketserver.UnixStreamServer):
+    """
+    Serves command lines over a Unix socket.
+
+    Every connection is a session: its lines are run one after another by a
+    Shell with a private copy of the environment, and everything the
+    commands print is sent back over the same connection. The session ends
+    when the client shuts down its side of the connection. At most
+    `workers` sessions run at a time, the rest wait for a free worker.
+
+    """
+
+    def __init__(self, path: str, env: dict, workers: Optional[int] = None):
+        if _stale(path):
+            # left behind by a server that did not shut down cleanly
+            os.unlink(path)
+        # socket file is only removed on close once this server made it
+        self._bound = False
+        # sessions get copies, they share its encoded snapshot
+        self.env = env if isinstance(env, Environment) else Environment(env)
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        super().__init__(path, _SessionHandler)
+
+    def server_bind(self) -> None:
+        super().server_bind()
+        self._bound = True
+
+    def process_request(self, request, client_address) -> None:
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown(wait=True)
+        if self._bound and os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class _SessionHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        env = self.server.env.copy()
+        lines = io.TextIOWrapper(self.request.makefile("rb"))
+        output = self.request.makefile("w")
+        with open(os.devnull, "r") as stdin, lines, output:
+            sh = Shell(stdin, output, output, env=env, parser=CliParser(env))
+            sh.run(lines)
+
+
+def _stale(path: str) -> bool:
+    """Whether path is a socket that no server accepts connections on."""
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return False
+    except FileNotFoundError:
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            return True
+    # a live server, binding fails with EADDRINUSE instead of stealing it
+    return False
+
+
+def serve(path: str, env: dict, workers: Optional[int] = None) -> int:
+    with ShellServer(path, env, workers) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
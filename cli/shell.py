@@ -1,11 +1,21 @@
-import traceback
+import io
+import os
 from io import IOBase
+from typing import Iterable, Optional
 
-from .common import Command
+from .common import Builtin, Command
+from .environment import Environment
 from .parser import Parser
+from .streams import BUFSIZE, memory_pipe, pipe
+from .workers import Task, workers
 
 
 class Shell:
+    # capacity asked for OS pipes between stages, None keeps the system default
+    pipe_size: Optional[int] = None
+    # finished jobs scripts can still `wait` for, the oldest are forgotten
+    keep_done: int = 64
+
     def __init__(
         self,
         stdin: IOBase,
@@ -13,6 +23,7 @@ class Shell:
         stderr: IOBase,
         env: dict,
         parser: Parser,
+        profiler=None,
     ):
         """
         Parameters
@@ -25,13 +36,18 @@ class Shell:
             standard error accordingly.
 
         env : dict
-            Dictionary with environment variables.
+            Dictionary with environment variables, an
+            `cli.environment.Environment` spares external
+            commands encoding it again for every spawn.
 
         parser : Parser
             Parser instance that will be used to
             parse input string recieved from standard
             input.
 
+        profiler : cli.profile.Profiler, optional
+            Records timings of every line and stage when given.
+
         """
 
         self.stdin = stdin
@@ -39,40 +55,552 @@ class Shell:
         self.stderr = stderr
         self.env = env
         self.parser = parser
+        self.profiler = profiler
+        # jobs started with '&' by id, until they are waited on or forgotten
+        self.jobs: dict[int, Job] = {}
+        if profiler is not None:
+            profiler.instrument(parser)
+
+    def run(self, script: Optional[Iterable[str]] = None) -> int:
+        """
+        Execute command lines until input ends or `exit` is called.
+
+        Jobs still running at that point are waited for.
+
+        Parameters
+        ----------
+        script : Iterable[str], optional
+            Lines to execute instead of reading them from standard input.
+            Prompt is only shown when reading from a terminal.
+
+        Returns
+        ----------
+        out : int
+            Exit status of the last pipeline.
+
+        """
+        interactive = script is None and _isatty(self.stdin)
+        lines = iter(self.stdin.readline, "") if script is None else iter(script)
+        status = 0
+        try:
+            while True:
+                if self.jobs:
+                    self._notify(interactive)
+                if interactive:
+                    self.stdout.write(" $ ")
+                    self.stdout.flush()
+                raw = next(lines, None)
+                if raw is None:
+                    break
+                if raw.endswith("\n"):
+                    raw = raw[:-1]
+                if not raw.strip() or raw.startswith("#"):
+                    continue
+                profiler = self.profiler
+                if profiler is not None:
+                    profiler.begin(raw)
+                try:
+                    if profiler is None:
+                        parts = self.parser.split(raw)
+                    else:
+                        parts = profiler.split(self.parser, raw)
+                    status = self._run_list(parts, interactive)
+                except (SystemExit, EOFError):
+                    break
+                except Exception:
+                    _print_error(self.stderr)
+                    status = 1
+                finally:
+                    if profiler is not None:
+                        profiler.end(status)
+            self.wait()
+            return status
+        finally:
+            self.stdout.flush()
+
+    def reap(self) -> list["Job"]:
+        """
+        Collect jobs that have finished since the last call, without blocking.
+
+        Returns
+        ----------
+        out : list[Job]
+            Newly finished jobs, they stay in `jobs` until waited on.
+
+        """
+        running = [job for job in self.jobs.values() if job.status is None]
+        return [job for job in running if self._poll(job) is not None]
+
+    def wait(self, job_id: Optional[int] = None) -> int:
+        """
+        Wait for a job to finish and forget it.
+
+        Parameters
+        ----------
+        job_id : int, optional
+            Id of the job in `jobs`, all of them are waited for without it.
+
+        Returns
+        ----------
+        out : int
+            Exit status of the job, 0 when all jobs are waited for.
 
-    def run(self) -> int:
-        while True:
+        """
+        if job_id is None:
+            for job_id in list(self.jobs):
+                self.wait(job_id)
+            return 0
+        job = self.jobs.pop(job_id)
+        status = job.wait(check=False)
+        self._report(job)
+        return status
+
+    def prepare(self, raw: str):
+        """
+        Parse raw once to be executed many times with `execute`.
+
+        Returns
+        ----------
+        out
+            Plan produced by the parser, see `Parser.compile`.
+
+        """
+        return self.parser.compile(raw)
+
+    def execute(self, plan, env: Optional[dict] = None) -> int:
+        """
+        Run a prepared plan.
+
+        Parameters
+        ----------
+        plan
+            Result of `prepare`.
+
+        env : dict, optional
+            Variables to expand and to run commands with,
+            shell environment by default.
+
+        Returns
+        ----------
+        out : int
+            Exit status of the pipeline.
+
+        """
+        env = self.env if env is None else env
+        if self.profiler is None:
+            return self._execute(plan.commands(env), env)
+        self.profiler.begin(None)
+        status = 1
+        try:
+            status = self._execute(plan.commands(env), env)
+            return status
+        finally:
+            self.profiler.end(status)
+
+    def _execute(self, pipeline: list[Command], env: Optional[dict] = None) -> int:
+        if env is None:
+            env = self.env
+        if not pipeline:
+            return 0
+        for command in pipeline:
+            if isinstance(command, Builtin):
+                command.shell = self
+        if len(pipeline) == 1 and not pipeline[0].redirects:
+            if self.profiler is not None:
+                return self._execute_profiled(pipeline[0], env)
+            status = pipeline[0].execute(env, self.stdin, self.stdout, self.stderr)
+            return _status(status)
+
+        return self._start_job(pipeline, env).wait()
+
+    def _run_list(self, parts: list[tuple[str, str]], interactive: bool = False) -> int:
+        """Run pipelines split by `Parser.split`, each parsed right before it runs."""
+        status = 0
+        # pipelines joined by '&&' run and go to the background together
+        group: list[str] = []
+        for source, separator in parts:
+            group.append(source)
+            if separator == "&&":
+                continue
+            if separator == "&":
+                status = self._background(group, interactive)
+            else:
+                status = self._run_and(group)
+            group = []
+        return status
+
+    def _run_and(self, sources: list[str]) -> int:
+        """Run pipelines one after another until one fails."""
+        status = 0
+        for source in sources:
             try:
-                self.stdout.write(" $ ")
-                self.stdout.flush()
-                raw: str = self.stdin.readline()
-                if not raw:
-                    raise EOFError
-                raw = raw[:-1]
-                pipeline: list[Command] = self.parser.parse(raw)
-                self._execute(pipeline)
-            except (SystemExit, EOFError):
-                return 0
+                status = self._execute(self._parse(source))
             except Exception:
-                traceback.print_exc(file=self.stderr)
+                _print_error(self.stderr)
+                status = 1
+            if status:
+                break
+        return status
 
-    def _execute(self, pipeline: list[Command]) -> None:
-        if not pipeline:
-            return
-        if len(pipeline) == 1:
-            pipeline[0].execute(self.env, self.stdin, self.stdout, self.stderr)
-            return
-
-        cmd = pipeline[0]
-        with open(cmd.outfd, "w") as stdout, open(cmd.errfd, "w") as stderr:
-            cmd.execute(self.env, self.stdin, stdout, stderr)
-
-        for command in pipeline[1:-1]:
-            with open(command.infd, "r") as stdin, open(
-                command.outfd, "w"
-            ) as stdout, open(command.errfd, "w") as stderr:
-                command.execute(self.env, stdin, stdout, stderr)
-
-        last: Command = pipeline[-1]
-        with open(last.infd, "r") as stdin:
-            last.execute(self.env, stdin, self.stdout, self.stderr)
+    def _parse(self, source: str) -> list[Command]:
+        if self.profiler is None:
+            return self.parser.parse(source)
+        return self.profiler.parse(self.parser, source)
+
+    def _background(self, sources: list[str], interactive: bool) -> int:
+        # like subshells elsewhere, jobs can not change variables of the shell
+        env = self._copy_env()
+        if len(sources) == 1:
+            pipeline = self._parse(sources[0])
+            for command in pipeline:
+                if isinstance(command, Builtin):
+                    command.shell = self
+            job = self._start_job(pipeline, env, background=True)
+        else:
+            job = self._start_list(sources, env)
+        job.id = max(self.jobs, default=0) + 1
+        self.jobs[job.id] = job
+        if interactive:
+            pid = "" if job.pid is None else f" {job.pid}"
+            self.stderr.write(f"[{job.id}]{pid}\n")
+        return 0
+
+    def _copy_env(self) -> dict:
+        if isinstance(self.env, Environment):
+            # copy-on-write, nothing is copied until someone assigns
+            return self.env.copy()
+        return dict(self.env)
+
+    def _start_list(self, sources: list[str], env: dict) -> "Job":
+        """Run pipelines on a worker, in a shell of their own like other shells do."""
+        stdin = open(os.devnull, "r")
+        sub = Shell(stdin, self.stdout, self.stderr, env, self.parser.bind(env))
+        sub.pipe_size = self.pipe_size
+
+        def run() -> int:
+            with stdin:
+                return sub._run_and(sources)
+
+        # a single stage, the worker running the whole chain
+        job = Job([])
+        job.stats = [None]
+        job.line = " && ".join(source.strip(" ") for source in sources)
+        try:
+            job.stages.append(workers.submit(run))
+        except BaseException:
+            stdin.close()
+            raise
+        return job
+
+    def _notify(self, interactive: bool) -> None:
+        for job in self.reap():
+            if interactive:
+                # like other shells, report once and forget the job
+                del self.jobs[job.id]
+                self.stderr.write(f"[{job.id}]  {job.state:<8}{job.command}\n")
+        if not interactive:
+            done = [
+                job_id for job_id, job in self.jobs.items() if job.status is not None
+            ]
+            for job_id in done[: len(done) - self.keep_done]:
+                del self.jobs[job_id]
+
+    def _poll(self, job: "Job") -> Optional[int]:
+        status = job.poll()
+        if status is not None:
+            self._report(job)
+        return status
+
+    def _report(self, job: "Job") -> None:
+        """Print errors of a finished background job, once."""
+        for error in job.errors:
+            _print_error(self.stderr, error)
+        job.errors.clear()
+
+    def _start_job(
+        self, pipeline: list[Command], env: dict, background: bool = False
+    ) -> "Job":
+        job = Job(pipeline, self.profiler)
+        # Stages that were not wired up by hand are connected with fresh pipes.
+        # Runs of builtins are fused: they pass chunks through memory and use
+        # no descriptors, real pipes are only needed next to processes.
+        inputs: list[Optional[IOBase]] = [None] * len(pipeline)
+        outputs: list[Optional[IOBase]] = [None] * len(pipeline)
+        piped = [False] * len(pipeline)
+        for i, (pr, nxt) in enumerate(zip(pipeline[:-1], pipeline[1:])):
+            if pr.outfd != 1 or nxt.infd != 0:
+                continue
+            if isinstance(pr, Builtin) and isinstance(nxt, Builtin):
+                reader, writer = memory_pipe()
+                job.fused.append((i, reader, writer))
+                inputs[i + 1] = io.BufferedReader(reader, BUFSIZE)
+                outputs[i] = io.BufferedWriter(writer, BUFSIZE)
+                # text layer is only added for stages that need it
+                if not (pr.binary_safe and nxt.binary_safe):
+                    inputs[i + 1] = io.TextIOWrapper(inputs[i + 1])
+                    outputs[i] = io.TextIOWrapper(outputs[i])
+            else:
+                piped[i] = True
+        if background and pipeline[0].infd == 0:
+            # like in other shells, jobs do not read lines meant for the shell
+            inputs[0] = open(os.devnull, "r")
+
+        # every stage is started before any is waited on, so data flows
+        # through the pipes while producers are still running
+        if self.profiler is not None and not background:
+            job.stats = [
+                self.profiler.stage(command.name, isinstance(command, Builtin))
+                for command in pipeline
+            ]
+        # OS pipes are only made right before their writer starts, so at most
+        # one end is not owned by a stage if starting one fails
+        following: Optional[IOBase] = None
+        try:
+            for i, command in enumerate(pipeline):
+                stdin, stdout = inputs[i], outputs[i]
+                if following is not None:
+                    stdin, following = following, None
+                if piped[i]:
+                    following, stdout = pipe(self.pipe_size)
+                stage = self._start(
+                    command, env, stdin, stdout, job.errors, job.stats[i]
+                )
+                job.stages.append(stage)
+        except BaseException:
+            # ends meant for stages that were never started
+            started = len(job.stages)
+            self._close(following, *inputs[started:], *outputs[started:])
+            job.wait(check=False)
+            raise
+        return job
+
+    def _start(
+        self,
+        command: Command,
+        env: dict,
+        stdin: Optional[IOBase],
+        stdout: Optional[IOBase],
+        errors: list[BaseException],
+        stats: Optional[dict] = None,
+    ):
+        """Start command, it owns stdin and stdout from now on."""
+        try:
+            stdin, stdout, stderr = self._open(command, stdin, stdout)
+        except BaseException:
+            self._close(stdin, stdout)
+            raise
+        run = (self._run_builtin, command, env, stdin, stdout, stderr, errors)
+        if isinstance(command, Builtin):
+            try:
+                if stats is not None:
+                    return workers.submit(self.profiler.call, stats, *run)
+                return workers.submit(*run)
+            except BaseException:
+                self._close(stdin, stdout, stderr)
+                raise
+        try:
+            if stats is not None:
+                return self.profiler.spawn(
+                    stats, command.start, env, stdin, stdout, stderr
+                )
+            return command.start(env, stdin, stdout, stderr)
+        except Exception as e:
+            errors.append(e)
+            return None
+        finally:
+            # child holds its own copies now
+            self._close(stdin, stdout, stderr)
+
+    def _execute_profiled(self, command: Command, env: dict) -> int:
+        profiler = self.profiler
+        stats = profiler.stage(command.name, isinstance(command, Builtin))
+        streams = (env, self.stdin, self.stdout, self.stderr)
+        if isinstance(command, Builtin):
+            return _status(profiler.call(stats, command.execute, *streams))
+        process = profiler.spawn(stats, command.start, *streams)
+        return _status(profiler.wait(stats, process))
+
+    def _run_builtin(
+        self,
+        command: Command,
+        env: dict,
+        stdin: IOBase,
+        stdout: IOBase,
+        stderr: IOBase,
+        errors: list[BaseException],
+    ) -> Optional[int]:
+        try:
+            return command.execute(env, stdin, stdout, stderr)
+        except BrokenPipeError as e:
+            # next stage stopped reading, not an error of this one
+            if stdout is self.stdout:
+                errors.append(e)
+        except BaseException as e:
+            if stderr is self.stderr:
+                errors.append(e)
+            else:
+                # redirected with 2>, reported there like errors of processes
+                _print_error(stderr, e)
+                return 1
+        finally:
+            self._close(stdin, stdout, stderr)
+
+    def _open(
+        self,
+        command: Command,
+        stdin: Optional[IOBase] = None,
+        stdout: Optional[IOBase] = None,
+    ) -> tuple[IOBase, IOBase, IOBase]:
+        if stdin is None:
+            stdin = self.stdin if command.infd == 0 else open(command.infd, "r")
+        if stdout is None:
+            stdout = self.stdout if command.outfd == 1 else open(command.outfd, "w")
+        stderr = self.stderr if command.errfd == 2 else open(command.errfd, "w")
+        if not command.redirects:
+            return stdin, stdout, stderr
+        # files replace pipes too, the next stage then just sees no input
+        streams = [stdin, stdout, stderr]
+        try:
+            for fd, path, mode in command.redirects:
+                replaced, streams[fd] = streams[fd], open(path, mode)
+                self._close(replaced)
+        except BaseException:
+            self._close(*streams)
+            raise
+        return streams[0], streams[1], streams[2]
+
+    def _close(self, *streams: IOBase) -> None:
+        for stream in streams:
+            if stream is None or stream in (self.stdin, self.stdout, self.stderr):
+                continue
+            try:
+                stream.close()
+            except OSError:
+                # reader went away before everything was flushed
+                pass
+
+
+class Job:
+    """
+    Stages of a started pipeline.
+
+    Pipelines run with '&' are kept in `Shell.jobs` until they are waited
+    on, the others are waited on as soon as all their stages are started.
+
+    """
+
+    def __init__(self, pipeline: list[Command], profiler=None):
+        self.pipeline = pipeline
+        self.profiler = profiler
+        # set once the job is added to `Shell.jobs`
+        self.id: Optional[int] = None
+        # command line shown by `jobs`, made from pipeline when not set
+        self.line: Optional[str] = None
+        # Task, process or None, for every stage started so far
+        self.stages: list = []
+        self.stats: list[Optional[dict]] = [None] * len(pipeline)
+        # (index of the writing stage, reader, writer) of in-memory pipes
+        self.fused: list[tuple] = []
+        self.errors: list[BaseException] = []
+        self.status: Optional[int] = None
+
+    @property
+    def command(self) -> str:
+        """Pipeline as a command line, without the original quoting."""
+        if self.line is not None:
+            return self.line
+        return " | ".join(" ".join([cmd.name] + cmd.args) for cmd in self.pipeline)
+
+    @property
+    def pid(self) -> Optional[int]:
+        """Id of the last process of the job, None if it has none."""
+        for stage in reversed(self.stages):
+            if stage is not None and not isinstance(stage, Task):
+                return stage.pid
+        return None
+
+    @property
+    def state(self) -> str:
+        if self.status is None:
+            return "Running"
+        return "Done" if self.status == 0 else f"Exit {self.status}"
+
+    def poll(self) -> Optional[int]:
+        """Exit status if every stage has finished, None otherwise."""
+        if self.status is None:
+            for stage in self.stages:
+                if isinstance(stage, Task):
+                    if stage.is_alive():
+                        return None
+                elif stage is not None and stage.poll() is None:
+                    return None
+            self.wait(check=False)
+        return self.status
+
+    def wait(self, check: bool = True) -> int:
+        """
+        Wait for every stage to finish, processes are reaped.
+
+        Parameters
+        ----------
+        check : bool
+            Raise the first error of a stage instead of returning.
+
+        Returns
+        ----------
+        out : int
+            Exit status of the last stage, 1 if a stage failed to run.
+
+        """
+        if self.status is None:
+            profiler = self.profiler
+            for stage, stat in zip(self.stages, self.stats):
+                if isinstance(stage, Task):
+                    stage.join()
+                elif stage is None:
+                    pass
+                elif stat is None:
+                    stage.wait()
+                else:
+                    profiler.wait(stat, stage)
+            for i, reader, writer in self.fused:
+                if self.stats[i] is not None:
+                    profiler.piped(self.stats[i], bytes_out=writer.bytes_written)
+                    profiler.piped(self.stats[i + 1], bytes_in=reader.bytes_read)
+            if self.errors or len(self.stages) < len(self.pipeline):
+                self.status = 1
+            elif isinstance(self.stages[-1], Task):
+                self.status = _status(self.stages[-1].result)
+            else:
+                self.status = _status(self.stages[-1].returncode)
+        if check and self.errors:
+            raise self.errors[0]
+        return self.status
+
+
+def _status(code: Optional[int]) -> int:
+    """Exit status the way shells report it, builtins return None on success."""
+    if code is None:
+        return 0
+    if code < 0:
+        # killed by a signal
+        return 128 - code
+    return code
+
+
+def _print_error(stream: IOBase, error: Optional[BaseException] = None) -> None:
+    """Print traceback of error, or of the exception being handled."""
+    # only imported once something fails
+    import traceback
+
+    if error is None:
+        traceback.print_exc(file=stream)
+    else:
+        traceback.print_exception(type(error), error, error.__traceback__, file=stream)
+
+
+def _isatty(stream: IOBase) -> bool:
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
@@ -0,0 +1,107 @@
+import os
+import signal
+import subprocess as sp
+from io import IOBase
+from typing import Optional, Union
+
+from .environment import environ
+from .streams import fileno
+
+POSIX_SPAWN = "posix_spawn"
+POPEN = "popen"
+
+# preferred way of starting external commands
+default_backend: str = POSIX_SPAWN if hasattr(os, "posix_spawn") else POPEN
+
+# Python ignores these, children expect the defaults like Popen restores them
+_DEFAULT_SIGNALS = tuple(
+    getattr(signal, name) for name in ("SIGPIPE", "SIGXFSZ") if hasattr(signal, name)
+)
+
+
+class SpawnedProcess:
+    """Popen-like handle of a process started with os.posix_spawn."""
+
+    def __init__(self, pid: int, args: list[str]):
+        self.pid = pid
+        self.args = args
+        self.returncode: Optional[int] = None
+
+    def poll(self) -> Optional[int]:
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def wait(self) -> int:
+        if self.returncode is None:
+            _, status = os.waitpid(self.pid, 0)
+            self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+
+def spawn(
+    argv: list[str],
+    executable: Optional[str],
+    env: dict,
+    stdin: IOBase,
+    stdout: IOBase,
+    stderr: IOBase,
+    backend: Optional[str] = None,
+) -> Union[SpawnedProcess, sp.Popen]:
+    """
+    Start argv with its standard streams connected to the given files.
+
+    posix_spawn is used when possible, Popen otherwise.
+
+    Parameters
+    ----------
+    env : dict
+        Variables of the process, an Environment hands over its encoded
+        snapshot so they are not encoded again for every spawn.
+
+    executable : str or None
+        Full path of the program, None to leave the search to Popen.
+
+    backend : str, optional
+        Force POSIX_SPAWN or POPEN instead of the module default.
+
+    """
+    env = environ(env)
+    if (backend or default_backend) == POSIX_SPAWN and executable is not None:
+        actions = _file_actions((stdin, stdout, stderr))
+        if actions is not None:
+            pid = os.posix_spawn(
+                executable,
+                argv,
+                env,
+                file_actions=actions,
+                setsigdef=_DEFAULT_SIGNALS,
+            )
+            return SpawnedProcess(pid, argv)
+    return sp.Popen(
+        argv, executable=executable, stdin=stdin, stdout=stdout, stderr=stderr, env=env
+    )
+
+
+def _file_actions(streams: tuple) -> Optional[list[tuple]]:
+    """
+    dup2 actions installing streams as fds 0, 1 and 2 of the child.
+
+    Returns None when they can not be expressed safely, for example when
+    a stream has no descriptor or one standard fd is moved onto another.
+
+    """
+    actions = []
+    for target, stream in enumerate(streams):
+        fd = fileno(stream)
+        if fd is None:
+            return None
+        if fd == target:
+            # standard descriptors are inherited as they are
+            continue
+        if fd < 3:
+            return None
+        actions.append((os.POSIX_SPAWN_DUP2, fd, target))
+    return actions
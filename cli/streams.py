@@ -0,0 +1,385 @@
+import errno
+import io
+import os
+import sys
+import threading
+from collections import deque
+from io import IOBase
+from typing import Iterator, Optional
+
+BUFSIZE = 1 << 17
+
+# errors meaning "this kind of transfer is not possible between these fds"
+_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ESPIPE, errno.EBADF}
+
+
+def fileno(stream: IOBase) -> Optional[int]:
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def binary(stream: IOBase) -> Optional[IOBase]:
+    """
+    Return byte stream underlying stream.
+
+    Returns
+    ----------
+    out : IOBase or None
+        stream itself if it is already binary, its buffer if it is a text
+        wrapper and None for text-only streams such as StringIO.
+
+    """
+    if isinstance(stream, io.TextIOBase):
+        return getattr(stream, "buffer", None)
+    return stream
+
+
+def chunks(stream: IOBase) -> Iterator[bytes]:
+    """
+    Read stream to the end in chunks of at most BUFSIZE bytes.
+
+    Binary chunks share one buffer, which is overwritten by the next one.
+
+    """
+    inp = _byte_source(stream)
+    if inp is None:
+        while chunk := stream.read(BUFSIZE):
+            yield chunk.encode()
+        return
+    buf = bytearray(BUFSIZE)
+    while n := inp.readinto(buf):
+        yield buf if n == BUFSIZE else buf[:n]
+
+
+def line_blocks(stream: IOBase) -> Iterator[bytes]:
+    """
+    Read stream to the end in blocks of whole lines.
+
+    Only the last block may not end with b"\n".
+
+    """
+    pending = bytearray()
+    for chunk in chunks(stream):
+        end = chunk.rfind(b"\n") + 1
+        if not end:
+            pending += chunk
+            continue
+        if pending:
+            pending += chunk[:end]
+            yield bytes(pending)
+        else:
+            yield bytes(chunk[:end])
+        pending = bytearray(chunk[end:])
+    if pending:
+        yield bytes(pending)
+
+
+def byte_output(stream: IOBase) -> IOBase:
+    """
+    Stream accepting bytes that end up in stream.
+
+    Text already written to stream is flushed first, so the order is kept.
+    Bytes written to text-only streams are decoded, callers should only
+    split them at line ends.
+
+    """
+    stream.flush()
+    out = binary(stream)
+    return _TextSink(stream) if out is None else out
+
+
+class _TextSink(io.RawIOBase):
+    def __init__(self, stream: IOBase):
+        self._stream = stream
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._stream.write(bytes(b).decode(errors="replace"))
+        return len(b)
+
+
+def copy(src: IOBase, dst: IOBase) -> None:
+    """
+    Copy everything from src to dst as bytes.
+
+    Kernel-side transfer is used when both streams are backed by file
+    descriptors, otherwise data goes through a single reusable buffer.
+    Falls back to copying text when either end has no bytes to offer, or
+    when src is a text wrapper that already read ahead of its consumers.
+
+    """
+    inp, out = _byte_source(src), binary(dst)
+    if out is None:
+        if inp is None or isinstance(src, io.TextIOBase):
+            for line in src:
+                dst.write(line)
+            return
+        text = io.TextIOWrapper(io.BufferedReader(src))
+        try:
+            for line in text:
+                dst.write(line)
+        finally:
+            # src belongs to the caller, the wrappers would close it when collected
+            text.detach().detach()
+        return
+    if inp is None:
+        dst.flush()
+        for line in src:
+            write_all(out, line.encode())
+        out.flush()
+        return
+
+    dst.flush()
+    infd, outfd = fileno(inp), fileno(out)
+    if infd is not None and outfd is not None:
+        if isinstance(inp, io.BufferedReader):
+            # bytes it buffered are no longer in the descriptor
+            write_all(out, inp.read1(BUFSIZE))
+            out.flush()
+        if _sendfile(infd, outfd) or _splice(infd, outfd):
+            return
+    _readinto(inp, out)
+
+
+def _byte_source(stream: IOBase) -> Optional[IOBase]:
+    """
+    Byte stream to read the rest of stream from.
+
+    Returns
+    ----------
+    out : IOBase or None
+        Like `binary`, but None as well when stream is a text wrapper that
+        holds decoded text its buffer no longer has.
+
+    """
+    if isinstance(stream, io.TextIOWrapper) and _read_ahead(stream):
+        return None
+    return binary(stream)
+
+
+def _read_ahead(src: io.TextIOWrapper) -> bool:
+    """Whether src may hold decoded text that was not read from it yet."""
+    try:
+        # refused while anything read from the buffer is left undelivered
+        src.reconfigure(errors=src.errors)
+    except io.UnsupportedOperation:
+        return True
+    return False
+
+
+def _sendfile(infd: int, outfd: int) -> bool:
+    first = True
+    while True:
+        try:
+            sent = os.sendfile(outfd, infd, None, BUFSIZE)
+        except OSError as e:
+            if first and e.errno in _UNSUPPORTED:
+                return False
+            raise
+        if not sent:
+            return True
+        first = False
+
+
+def _splice(infd: int, outfd: int) -> bool:
+    if not hasattr(os, "splice"):
+        return False
+    first = True
+    while True:
+        try:
+            moved = os.splice(infd, outfd, BUFSIZE)
+        except OSError as e:
+            if first and e.errno in _UNSUPPORTED:
+                return False
+            raise
+        if not moved:
+            return True
+        first = False
+
+
+def _readinto(inp: IOBase, out: IOBase) -> None:
+    buf = bytearray(BUFSIZE)
+    view = memoryview(buf)
+    while True:
+        n = inp.readinto(buf)
+        if not n:
+            break
+        write_all(out, view[:n])
+    out.flush()
+
+
+def write_all(out: IOBase, data) -> None:
+    # raw streams are allowed to write less than asked
+    view = memoryview(data)
+    while view:
+        view = view[out.write(view) :]
+
+
+def write_text(out: IOBase, text: str) -> None:
+    """Write text to either a text or a binary stream."""
+    if isinstance(out, io.TextIOBase):
+        out.write(text)
+    else:
+        write_all(out, text.encode())
+
+
+def pipe(size: Optional[int] = None) -> tuple[IOBase, IOBase]:
+    """
+    Text-mode ends of a new OS pipe, reader first.
+
+    Parameters
+    ----------
+    size : int, optional
+        Capacity to ask the kernel for with F_SETPIPE_SZ where supported.
+        Larger pipes let a producer write more before it is switched out,
+        failures to resize are ignored.
+
+    """
+    rfd, wfd = os.pipe()
+    try:
+        if size:
+            _set_pipe_size(wfd, size)
+        reader = io.TextIOWrapper(io.BufferedReader(_PipeEnd(rfd, "r")))
+    except BaseException:
+        os.close(rfd)
+        os.close(wfd)
+        raise
+    writer = io.TextIOWrapper(io.BufferedWriter(_PipeEnd(wfd, "w")))
+    return reader, writer
+
+
+def open_pipe_fds() -> int:
+    """Number of descriptors made by `pipe` that are not closed yet."""
+    return _PipeEnd.opened
+
+
+def _set_pipe_size(fd: int, size: int) -> None:
+    try:
+        import fcntl
+    except ImportError:
+        return
+    # only exposed by fcntl since Python 3.10, the value is the same on Linux
+    command = getattr(fcntl, "F_SETPIPE_SZ", 1031 if sys.platform == "linux" else None)
+    if command is None:
+        return
+    try:
+        fcntl.fcntl(fd, command, size)
+    except OSError:
+        # above /proc/sys/fs/pipe-max-size for unprivileged users
+        pass
+
+
+class _PipeEnd(io.FileIO):
+    """FileIO counting how many pipe ends are open."""
+
+    opened = 0
+    _lock = threading.Lock()
+
+    def __init__(self, fd: int, mode: str):
+        super().__init__(fd, mode)
+        with _PipeEnd._lock:
+            _PipeEnd.opened += 1
+
+    def close(self) -> None:
+        if not self.closed:
+            with _PipeEnd._lock:
+                _PipeEnd.opened -= 1
+        super().close()
+
+
+def memory_pipe(capacity: int = BUFSIZE * 8) -> tuple["PipeReader", "PipeWriter"]:
+    """
+    In-process replacement for os.pipe between two threads.
+
+    Written chunks are handed over as they are. Writer blocks while more
+    than capacity bytes are waiting, and gets BrokenPipeError once the
+    reader is closed, just like with a real pipe.
+
+    """
+    channel = _Channel(capacity)
+    return PipeReader(channel), PipeWriter(channel)
+
+
+class _Channel:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.cond = threading.Condition()
+        self.chunks: deque[memoryview] = deque()
+        self.size = 0
+        self.writer_closed = False
+        self.reader_closed = False
+
+
+class PipeReader(io.RawIOBase):
+    def __init__(self, channel: _Channel):
+        self._channel = channel
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        channel = self._channel
+        with channel.cond:
+            while not channel.chunks and not channel.writer_closed:
+                channel.cond.wait()
+            if not channel.chunks:
+                return 0
+            chunk = channel.chunks[0]
+            n = min(len(b), len(chunk))
+            b[:n] = chunk[:n]
+            if n == len(chunk):
+                channel.chunks.popleft()
+            else:
+                channel.chunks[0] = chunk[n:]
+            channel.size -= n
+            channel.cond.notify_all()
+            self.bytes_read += n
+            return n
+
+    def close(self) -> None:
+        if not self.closed:
+            channel = self._channel
+            with channel.cond:
+                channel.reader_closed = True
+                channel.chunks.clear()
+                channel.size = 0
+                channel.cond.notify_all()
+        super().close()
+
+
+class PipeWriter(io.RawIOBase):
+    def __init__(self, channel: _Channel):
+        self._channel = channel
+        self.bytes_written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        # caller is free to reuse its buffer once write returns
+        chunk = memoryview(bytes(b))
+        channel = self._channel
+        with channel.cond:
+            while channel.size >= channel.capacity and not channel.reader_closed:
+                channel.cond.wait()
+            if channel.reader_closed:
+                raise BrokenPipeError(errno.EPIPE, "Reader is closed")
+            if chunk:
+                channel.chunks.append(chunk)
+                channel.size += len(chunk)
+                channel.cond.notify_all()
+        self.bytes_written += len(chunk)
+        return len(chunk)
+
+    def close(self) -> None:
+        if not self.closed:
+            channel = self._channel
+            with channel.cond:
+                channel.writer_closed = True
+                channel.cond.notify_all()
+        super().close()
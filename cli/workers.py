@@ -0,0 +1,96 @@
+import queue
+import threading
+from typing import Callable
+
+
+class Task:
+    def __init__(self, fn: Callable, args: tuple):
+        self.fn = fn
+        self.args = args
+        self.result = None
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        try:
+            self.result = self.fn(*self.args)
+        finally:
+            self._done.set()
+
+    def join(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def is_alive(self) -> bool:
+        return not self._done.is_set()
+
+
+class Workers:
+    """
+    Threads running builtin stages, kept around between pipelines.
+
+    Unlike ThreadPoolExecutor a task never waits for a free worker, stages
+    of one pipeline feed each other and must all run at the same time.
+    Workers that stay idle for idle_timeout seconds exit.
+
+    """
+
+    def __init__(self, idle_timeout: float = 30.0):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # idle workers not yet promised to a submitted task
+        self._idle = 0
+        self._tasks: queue.SimpleQueue = queue.SimpleQueue()
+
+    def submit(self, fn: Callable, *args) -> Task:
+        task = Task(fn, args)
+        with self._lock:
+            start = not self._idle
+            if not start:
+                self._idle -= 1
+        self._tasks.put(task)
+        if start:
+            threading.Thread(target=self._work, daemon=True).start()
+        return task
+
+    def _work(self) -> None:
+        while True:
+            try:
+                task = self._tasks.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    # every idle worker is promised, one of the tasks is ours
+                    if not self._idle:
+                        continue
+                    self._idle -= 1
+                    return
+            task.run()
+            with self._lock:
+                self._idle += 1
+
+
+workers = Workers()
+_processes = None
+
+
+def processes():
+    """
+    Process pool for CPU-bound work of builtins, started on first use.
+
+    Builtins run on threads and forking the shell itself is not safe,
+    so processes are started by a fork server where there is one.
+
+    """
+    global _processes
+    if _processes is None:
+        import atexit
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+        _processes = ProcessPoolExecutor(mp_context=context)
+        # pool is created lazily, possibly on a worker thread, make sure it is
+        # shut down while the interpreter is still intact
+        atexit.register(_processes.shutdown)
+    return _processes
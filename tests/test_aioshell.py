@@ -0,0 +1,102 @@
+import asyncio
+import io
+import os
+import tempfile
+import unittest as ut
+from unittest import mock
+
+from cli import aioshell
+from cli.aioshell import AsyncShell, run_pipeline_async
+
+
+class AsyncShellTest(ut.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.stderr = open(os.devnull, "w")
+        self.sh = AsyncShell({"PATH": os.defpath}, stderr=self.stderr)
+
+    def tearDown(self):
+        self.stderr.close()
+
+    async def test_builtins(self):
+        self.assertEqual((0, b"1 2 12"), await self.sh.run("echo hello world | wc"))
+
+    async def test_mixed(self):
+        status, output = await self.sh.run("echo hello | tr a-z A-Z | cat")
+        self.assertEqual((0, b"HELLO\n"), (status, output))
+
+    async def test_status(self):
+        self.assertEqual((3, b""), await self.sh.run("sh -c 'exit 3'"))
+
+    async def test_stream(self):
+        pipeline = await run_pipeline_async("seq 1 100000 | cat", {"PATH": os.defpath})
+        received = io.BytesIO()
+        async for chunk in pipeline:
+            received.write(chunk)
+        self.assertEqual(0, await pipeline.wait())
+        self.assertEqual(100000, received.getvalue().count(b"\n"))
+
+    async def test_concurrent(self):
+        runs = [self.sh.run(f"echo {i} | cat | wc -w") for i in range(100)]
+        self.assertEqual([(0, b"1")] * 100, await asyncio.gather(*runs))
+
+    async def test_error(self):
+        with self.assertRaises(FileNotFoundError):
+            await self.sh.run("no-such-command-here")
+
+    async def test_redirects(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out")
+            status, output = await self.sh.run(f"echo b a > {path} | cat")
+            self.assertEqual((0, b""), (status, output))
+            await self.sh.run(f"tr ab ba < {path} >> {path}.2 2> {path}.err")
+            self.assertEqual((0, b"a b\n"), await self.sh.run(f"cat < {path}.2"))
+            with open(f"{path}.err") as f:
+                self.assertEqual("", f.read())
+            # errors of builtins go to the redirected stderr as well
+            status, _ = await self.sh.run(f"sort -Q {path} 2> {path}.err")
+            self.assertEqual(1, status)
+            with open(f"{path}.err") as f:
+                self.assertIn("invalid option -- 'Q'", f.read())
+
+    async def test_stderr_without_descriptor(self):
+        with self.assertRaises(ValueError):
+            AsyncShell({}, stderr=io.StringIO())
+        self.sh.stderr = io.StringIO()
+        with self.assertRaises(ValueError):
+            await asyncio.wait_for(self.sh.run("echo a"), 5)
+
+    async def test_builtin_streams_fail(self):
+        with mock.patch.object(aioshell, "_text", side_effect=ValueError("no stream")):
+            with self.assertRaises(ValueError):
+                await asyncio.wait_for(self.sh.run("echo a | wc"), 5)
+
+    async def test_started_stages_reaped(self):
+        started = []
+        spawn = asyncio.create_subprocess_exec
+
+        async def record(*args, **kwargs):
+            started.append(await spawn(*args, **kwargs))
+            return started[-1]
+
+        with mock.patch("asyncio.create_subprocess_exec", record):
+            with self.assertRaises(FileNotFoundError):
+                await self.sh.run("sleep 10 | no-such-command-here")
+        (sleep,) = started
+        self.assertIsNotNone(sleep.returncode)
+
+    async def test_failed_stage_waits_for_others(self):
+        started = []
+        spawn = asyncio.create_subprocess_exec
+
+        async def record(*args, **kwargs):
+            started.append(await spawn(*args, **kwargs))
+            return started[-1]
+
+        with mock.patch("asyncio.create_subprocess_exec", record), mock.patch.object(
+            aioshell, "_text", side_effect=ValueError("no stream")
+        ):
+            with self.assertRaises(ValueError):
+                await self.sh.run("echo a | sh -c 'exec >&-; sleep 0.2'")
+        # output ends at once, raised only after the process ended as well
+        (sh,) = started
+        self.assertIsNotNone(sh.returncode)
@@ -1,9 +1,11 @@
-from unittest import TestCase
+from unittest import TestCase, mock
 
-from cli.builtins import Cat, Echo, Eq, Exit
-from cli.clicommandfactory import _del_conseq, _remove_quotes_if_needed, _splitat
+from cli import builtins
+from cli.builtins import Cat, Echo, Eq, Exit, Pwd
+from cli.clicommandfactory import _remove_quotes_if_needed
 from cli.clilexer import CliLexer
 from cli.cliparser import CliParser
+from cli.common import Builtin, Command
 
 
 class CliParserTest(TestCase):
@@ -129,20 +131,231 @@ class TokenizeTest(TestCase):
         raw = "a=b"
         self.assertEqual(["a", "=", "b"], self.lexer.tokenize(raw))
 
+    def test_quote_inside_word(self):
+        raw = ['ab"c', " ", 'd"']
+        self.assertEqual(raw, self.lexer.tokenize("".join(raw)))
 
-class HelpersTest(TestCase):
-    def test_splitat(self):
-        echo = [" ", " ", "echo", " ", "hello", " "]
-        cat = [" ", "cat"]
-        pipe = echo + ["|"] + cat
-        self.assertEqual([echo, cat], _splitat(pipe, lambda x: x == "|"))
+    def test_unbalanced_inside_word(self):
+        with self.assertRaises(SyntaxError):
+            self.lexer.tokenize("ab\"c 'd'")
+
+
+class CommandListTest(TestCase):
+    def _steps(self, raw: str) -> list[tuple[list[str], str]]:
+        parser = CliParser()
+        return [
+            (list(map(str, parser.parse(source))), separator)
+            for source, separator in parser.split(raw)
+        ]
 
-    def test__del_conseq(self):
-        echo = [" ", " ", "echo", " ", "hello", " "]
-        self.assertEqual(echo[1:], _del_conseq(echo, lambda x: x == " "))
+    def test_tokens(self):
+        lexer = CliLexer({"a": "x"})
+        self.assertEqual(["a", ";", "b", "&&", "x", "&"], lexer.tokenize("a;b&&$a&"))
+        self.assertEqual(["'a;b&c'", " ", '"x&&"'], lexer.tokenize("'a;b&c' \"$a&&\""))
+
+    def test_separators(self):
+        echo, pwd = [str(Echo("echo", ["a"]))], [str(Pwd("pwd", []))]
+        self.assertEqual([(echo, ";")], self._steps("echo a"))
+        self.assertEqual([(echo, ";")], self._steps("echo a ; "))
+        self.assertEqual(
+            [(echo, "&&"), (pwd, "&"), (echo, ";")],
+            self._steps("echo a && pwd & echo a"),
+        )
+
+    def test_invalid(self):
+        for raw in ("; echo", "echo ;; echo", "echo &&", "echo & &", "echo | ;"):
+            with self.subTest(raw=raw), self.assertRaises(SyntaxError):
+                self._steps(raw)
+
+    def test_split(self):
+        parser = CliParser({"a": "x;y"})
+        self.assertEqual(
+            [("a=1", ";"), (" echo '$a;' \"&&\" $a ", "&&"), (" pwd", "&")],
+            parser.split("a=1; echo '$a;' \"&&\" $a && pwd&"),
+        )
+        # nothing is expanded yet, values can not split the line
+        self.assertEqual([("echo $a", ";")], parser.split("echo $a"))
+        for raw in ("; echo", "echo ;; echo", "echo &&", "echo & &"):
+            with self.subTest(raw=raw), self.assertRaises(SyntaxError):
+                parser.split(raw)
+
+    def test_single_pipeline(self):
+        with self.assertRaises(SyntaxError):
+            CliParser().parse("echo a; echo b")
+        with self.assertRaises(SyntaxError):
+            CliParser().compile("echo a &")
 
+
+class RedirectTest(TestCase):
+    def test_tokens(self):
+        lexer = CliLexer({})
+        self.assertEqual(
+            ["a", "<", "b", ">", "c", " ", "2>", "d", " ", ">>", "e"],
+            lexer.tokenize("a<b>c 2>d >>e"),
+        )
+        # '2' in the middle of a word is not a descriptor
+        self.assertEqual(["a2", ">", "b", " ", "'x>y'"], lexer.tokenize("a2>b 'x>y'"))
+
+    def test_parse(self):
+        (cmd,) = CliParser().parse("> out sort -r < 'in put' 2>> err")
+        self.assertEqual(("sort", ["-r"]), (cmd.name, cmd.args))
+        self.assertEqual(
+            ((1, "out", "w"), (0, "in put", "r"), (2, "err", "a")), cmd.redirects
+        )
+        cat, wc = CliParser().parse("cat a >b | wc")
+        self.assertEqual(((1, "b", "w"),), cat.redirects)
+        self.assertEqual((), wc.redirects)
+
+    def test_invalid(self):
+        for raw in ("cat >", "cat > | wc", "cat < > a", "> a", "> a | wc"):
+            with self.subTest(raw=raw), self.assertRaises(SyntaxError):
+                CliParser().parse(raw)
+
+    def test_plan(self):
+        plan = CliParser().compile("cat < $src > out-$n")
+        (cmd,) = plan.commands({"src": "a", "n": "1"})
+        self.assertEqual(((0, "a", "r"), (1, "out-1", "w")), cmd.redirects)
+        with self.assertRaises(SyntaxError):
+            plan.commands({"src": ">", "n": "1"})
+
+    def test_cached_copies(self):
+        parser = CliParser()
+        first, second = parser.parse("cat > a"), parser.parse("cat > a")
+        self.assertIsNot(first[0], second[0])
+        self.assertEqual(first[0].redirects, second[0].redirects)
+
+
+class HelpersTest(TestCase):
     def test_remove_quotes_if_needed(self):
         a = "'heck'"
         self.assertEqual(a[1:-1], _remove_quotes_if_needed(a))
         self.assertEqual(a[1:-1], _remove_quotes_if_needed(a[1:-1]))
         self.assertEqual("", _remove_quotes_if_needed(""))
+
+
+class ParseCacheTest(TestCase):
+    def test_hit(self):
+        parser = CliParser({"a": "b"})
+        first = parser.parse("echo $a | cat")
+        second = parser.parse("echo $a | cat")
+        self.assertEqual(list(map(str, first)), list(map(str, second)))
+        self.assertIsNot(first[0], second[0])
+        self.assertIsNot(first[0].args, second[0].args)
+        self.assertEqual((1, 1, 0), parser.cache_info()[:3])
+
+    def test_env_change(self):
+        env = {"a": "b"}
+        parser = CliParser(env)
+        parser.parse('echo "$a"')
+        env["a"] = "c"
+        parsed = list(map(str, parser.parse('echo "$a"')))
+        self.assertEqual([str(Echo("echo", ["c"]))], parsed)
+        self.assertEqual((0, 2, 0), parser.cache_info()[:3])
+
+    def test_unrelated_env_change(self):
+        env = {"a": "b"}
+        parser = CliParser(env)
+        parser.parse("echo $a")
+        env["c"] = "d"
+        parser.parse("echo $a")
+        self.assertEqual((1, 1, 0), parser.cache_info()[:3])
+
+    def test_eviction(self):
+        parser = CliParser(cache_size=2)
+        for raw in ["echo a", "echo b", "echo c", "echo a"]:
+            parser.parse(raw)
+        self.assertEqual((0, 4, 2, 2, 2), parser.cache_info())
+
+    def test_disabled(self):
+        parser = CliParser(cache_size=0)
+        parser.parse("echo")
+        parser.parse("echo")
+        self.assertEqual((0, 0, 0, 0, 0), parser.cache_info())
+
+
+class PlanTest(TestCase):
+    def test_commands(self):
+        plan = CliParser().compile('cat $f | echo "a $b" $c$f')
+        self.assertEqual(("f", "b", "c"), plan.variables)
+        for env in ({"f": "x", "b": "y", "c": "z"}, {"f": "1", "b": "2", "c": "3"}):
+            with self.subTest(env=env):
+                expected = list(map(str, CliParser(env, cache_size=0).parse(plan.raw)))
+                self.assertEqual(expected, list(map(str, plan.commands(env))))
+
+    def test_fresh(self):
+        plan = CliParser().compile("echo $a")
+        first, second = plan.commands({"a": "b"}), plan.commands({"a": "b"})
+        self.assertIsNot(first[0], second[0])
+
+    def test_late_binding(self):
+        plan = CliParser().compile("$cmd hello")
+        self.assertIsInstance(plan.commands({"cmd": "echo"})[0], Echo)
+        self.assertIsInstance(plan.commands({"cmd": "cat"})[0], Cat)
+
+    def test_structural_values(self):
+        # values that change the shape of the line are parsed in full
+        plan = CliParser().compile("echo $a")
+        self.assertEqual([str(Echo("echo", []))], list(map(str, plan.commands({}))))
+        with self.assertRaises(SyntaxError):
+            plan.commands({"a": "|"})
+
+    def test_invalid(self):
+        with self.assertRaises(SyntaxError):
+            CliParser().compile("echo |")
+
+
+class Upper(Builtin):
+    def execute(self, env, stdin, stdout, stderr):
+        stdout.write(stdin.read().upper())
+
+
+class RegistryTest(TestCase):
+    def tearDown(self):
+        builtins.unregister("upper")
+
+    def test_lookup(self):
+        self.assertIs(builtins.lookup("cat"), Cat)
+        self.assertIsNone(builtins.lookup("ls"))
+
+    def test_register(self):
+        parser = CliParser()
+        self.assertIs(type(parser.parse("upper")[0]), Command)
+        builtins.register("upper", Upper)
+        self.assertIn("upper", builtins.names())
+        # cached pipeline is not reused with the old binding
+        self.assertIs(type(parser.parse("upper")[0]), Upper)
+        builtins.unregister("upper")
+        self.assertIs(type(parser.parse("upper")[0]), Command)
+
+    def test_register_reference(self):
+        builtins.register("upper", f"{__name__}:Upper")
+        self.assertIs(type(CliParser().parse("upper a")[0]), Upper)
+
+    def test_register_invalid(self):
+        with self.assertRaises(TypeError):
+            builtins.register("upper", str)
+        with self.assertRaises(ValueError):
+            builtins.register("upper", f"{__name__}.Upper")
+
+    def test_entry_points(self):
+        from importlib.metadata import EntryPoint
+
+        group = builtins.ENTRY_POINT_GROUP
+        ep = EntryPoint("upper", f"{__name__}:Upper", group)
+        # groups are selected since Python 3.10, a dict of them before
+        selectable = mock.Mock()
+        selectable.select.side_effect = lambda group: [ep]
+        for found in (selectable, {group: [ep]}):
+            with self.subTest(found=type(found).__name__), mock.patch.object(
+                builtins, "_discovered", False
+            ), mock.patch("importlib.metadata.entry_points", return_value=found):
+                self.assertIs(builtins.lookup("upper"), Upper)
+                builtins.unregister("upper")
+
+    def test_entry_points_failed(self):
+        with mock.patch.object(builtins, "_discovered", False), mock.patch(
+            "importlib.metadata.entry_points", side_effect=OSError
+        ):
+            self.assertRaises(OSError, builtins.lookup, "upper")
+            # the scan is tried again by the next lookup
+            self.assertFalse(builtins._discovered)
@@ -1,11 +1,47 @@
+import fcntl
+import gc
+import io
+import json
 import os
+import shutil
+import socket
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 import unittest as ut
 from contextlib import contextmanager
+from typing import Optional
+from unittest import mock
 
-from cli.builtins import Cat, Echo, Eq, Exit, Pwd, Wc
-from cli.common import Command
+from cli import builtins
+from cli.__main__ import main
+from cli.builtins import (
+    Cat,
+    Echo,
+    Eq,
+    Exit,
+    Grep,
+    Hash,
+    Head,
+    Parallel,
+    Pwd,
+    Sort,
+    Tail,
+    Wc,
+)
+from cli.builtins.parallel import parallel
+from cli.cliparser import CliParser
+from cli.common import Builtin, Command
+from cli.environment import Environment
+from cli.pathcache import path_cache
+from cli.profile import Profiler
+from cli.server import ShellServer
 from cli.shell import Shell
+from cli.spawn import POPEN, POSIX_SPAWN, spawn
+from cli.streams import BUFSIZE, copy, memory_pipe, open_pipe_fds, pipe
+from cli.workers import Workers
 
 
 # https://stackoverflow.com/questions/47066063/how-to-capture-python-subprocess-stdout-in-unittest
@@ -138,3 +174,968 @@ class ExecutorTest(ut.TestCase):
             sh._execute(pipeline)
             self.assertIn("a", env)
             self.assertEqual("b", env["a"])
+
+    def test_pipes_large(self):
+        # more than a kernel pipe buffer has to pass between the stages
+        line = "x" * 99 + "\n"
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as f:
+            f.write(line * 10000)
+            f.flush()
+
+            pipe1, pipe2 = os.pipe(), os.pipe()
+            pipeline = [
+                Cat("cat", [f.name], outfd=pipe1[1]),
+                Command("cat", [], infd=pipe1[0], outfd=pipe2[1]),
+                Wc("wc", [], infd=pipe2[0]),
+            ]
+            stdin, stdout, stderr = os.pipe(), os.pipe(), os.pipe()
+            with open(stdin[0], "r") as sin, open(stdout[1], "w") as sout, open(
+                stderr[1], "w"
+            ) as serr:
+                sh = Shell(sin, sout, serr, {}, None)
+                sh._execute(pipeline)
+            with open(stdout[0], "r") as res:
+                self.assertEqual(res.read().split(" ")[0], "10000")
+
+
+class CatTest(ut.TestCase):
+    def test_text_streams(self):
+        stdout = io.StringIO()
+        Cat("cat", []).execute({}, io.StringIO("hello\nworld\n"), stdout, None)
+        self.assertEqual("hello\nworld\n", stdout.getvalue())
+
+    def test_file_to_text_stream(self):
+        stdout = io.StringIO()
+        Cat("cat", ["./tests/test.txt"]).execute({}, None, stdout, None)
+        self.assertEqual("This is a test file.\n", stdout.getvalue())
+
+    def test_source_left_open(self):
+        stdout = io.StringIO()
+        with open("./tests/test.txt", "rb", buffering=0) as f:
+            copy(f, stdout)
+            gc.collect()
+            # the file is still the caller's to use and close
+            self.assertFalse(f.closed)
+            self.assertEqual(0, f.seek(0))
+        self.assertEqual("This is a test file.\n", stdout.getvalue())
+
+    def test_binary(self):
+        data = bytes(range(256)) * 1024
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            self.assertEqual(data * 2, _run(Cat("cat", [f.name, f.name]), b""))
+
+    def test_binary_stdin(self):
+        data = b"\xff\xfe\x00" * 100000
+        self.assertEqual(data, _run(Cat("cat", []), data))
+
+    def test_read_ahead(self):
+        # the rest of a stream that was partly read already, text or bytes
+        for mode in ("r", "rb"):
+            rfd, wfd = os.pipe()
+            os.write(wfd, b"a\nb\nc\n")
+            os.close(wfd)
+            with open(rfd, mode) as stdin, tempfile.TemporaryFile("w+") as stdout:
+                stdin.readline()
+                Cat("cat", []).execute({}, stdin, stdout, None)
+                stdout.seek(0)
+                self.assertEqual("b\nc\n", stdout.read())
+
+
+def _run(command: Command, data: bytes) -> bytes:
+    """Run command between two pipes, feeding it data."""
+    src, dst = os.pipe(), os.pipe()
+
+    def feed():
+        with open(src[1], "wb") as f:
+            f.write(data)
+
+    def execute():
+        with open(src[0], "r") as stdin, open(dst[1], "w") as stdout:
+            command.execute({}, stdin, stdout, None)
+
+    threads = [threading.Thread(target=feed), threading.Thread(target=execute)]
+    for thread in threads:
+        thread.start()
+    with open(dst[0], "rb") as res:
+        content = res.read()
+    for thread in threads:
+        thread.join()
+    return content
+
+
+class WcTest(ut.TestCase):
+    def _wc(self, args: list[str], text: str) -> str:
+        stdout = io.StringIO()
+        Wc("wc", args).execute({}, io.StringIO(text), stdout, None)
+        return stdout.getvalue()
+
+    def test_counts(self):
+        self.assertEqual("2 4 22", self._wc([], "hello  world\n\tfoo bar\n"))
+
+    def test_flags(self):
+        text = "hello  world\n\tfoo bar\n"
+        self.assertEqual("2", self._wc(["-l"], text))
+        self.assertEqual("4 22", self._wc(["-w", "-c"], text))
+        self.assertEqual("2 22", self._wc(["-cl"], text))
+
+    def test_invalid_flag(self):
+        with self.assertRaises(ValueError):
+            self._wc(["-x"], "")
+
+    def test_chunk_edges(self):
+        # words straddle every chunk boundary
+        data = (b"ab " * (BUFSIZE // 3 + 1) + b"cd\n") * 3
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            expected = b"3 %d %d" % (len(data.split()), len(data))
+            self.assertEqual(expected, _run(Wc("wc", [f.name]), b""))
+
+    def test_parallel(self):
+        data = [b"ab cd\n" * 1000, b"", b"x" * 5000 + b" y\n"]
+        files = []
+        for content in data:
+            f = tempfile.NamedTemporaryFile()
+            f.write(content)
+            f.flush()
+            files.append(f)
+        wc = Wc("wc", [f.name for f in files])
+        wc.parallel_threshold, wc.segment = 0, 1024
+        try:
+            self.assertEqual(b"1000 2000 6000\n0 0 0\n1 2 5003", _run(wc, b""))
+        finally:
+            for f in files:
+                f.close()
+
+
+def _text(command: Command, text: str) -> tuple[Optional[int], str]:
+    stdout = io.StringIO()
+    status = command.execute({}, io.StringIO(text), stdout, None)
+    return status, stdout.getvalue()
+
+
+class GrepTest(ut.TestCase):
+    TEXT = "foo\nbar\nbaz foo\nqux"
+
+    def _grep(self, args: list[str], text: str = TEXT) -> tuple[Optional[int], str]:
+        return _text(Grep("grep", args), text)
+
+    def test_select(self):
+        self.assertEqual((None, "foo\nbaz foo\n"), self._grep(["foo"]))
+        self.assertEqual((None, "bar\nqux\n"), self._grep(["-v", "foo"]))
+        self.assertEqual((None, "bar\nbaz foo\n"), self._grep(["^ba"]))
+        self.assertEqual((None, "foo\n"), self._grep(["-i", "^FOO$"]))
+
+    def test_count(self):
+        self.assertEqual((None, "2\n"), self._grep(["-c", "ba"]))
+        self.assertEqual((None, "2\n"), self._grep(["-cv", "ba"]))
+
+    def test_fixed(self):
+        text = "a.c\nabc\n"
+        self.assertEqual((None, "a.c\n"), self._grep(["-F", "a.c"], text))
+        self.assertEqual((None, text), self._grep(["a.c"], text))
+
+    def test_no_match(self):
+        self.assertEqual((1, ""), self._grep(["zzz"]))
+        with self.assertRaises(ValueError):
+            self._grep([])
+
+    def test_files(self):
+        data = b"x\n" + b"y\n" * BUFSIZE + b"x"
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            grep = Grep("grep", ["-c", "x", f.name, "./tests/test.txt"])
+            expected = f"{f.name}:2\n./tests/test.txt:0\n".encode()
+            self.assertEqual(expected, _run(grep, b""))
+
+
+class HeadTailTest(ut.TestCase):
+    TEXT = "a\nb\nc"
+
+    def test_head(self):
+        self.assertEqual((None, "a\nb\n"), _text(Head("head", ["-n", "2"]), self.TEXT))
+        self.assertEqual((None, "a\n"), _text(Head("head", ["-1"]), self.TEXT))
+        text = "".join(f"{i}\n" for i in range(20))
+        self.assertEqual((None, text[:20]), _text(Head("head", []), text))
+
+    def test_tail(self):
+        self.assertEqual((None, "c"), _text(Tail("tail", ["-n1"]), self.TEXT))
+        self.assertEqual((None, "b\nc"), _text(Tail("tail", ["-2"]), self.TEXT))
+        self.assertEqual((None, "c"), _text(Tail("tail", ["-n", "+3"]), self.TEXT))
+        self.assertEqual((None, ""), _text(Tail("tail", ["-n", "0"]), self.TEXT))
+
+    def test_invalid_count(self):
+        with self.assertRaises(ValueError):
+            _text(Head("head", ["-n", "x"]), self.TEXT)
+        with self.assertRaises(ValueError):
+            _text(Tail("tail", ["-n"]), self.TEXT)
+
+    def test_tail_across_chunks(self):
+        data = b"".join(b"%d\n" % i for i in range(100000))
+        self.assertEqual(b"99998\n99999\n", _run(Tail("tail", ["-n", "2"]), data))
+
+    def test_head_stops_producer(self):
+        # `yes` never ends, the pipeline only finishes if head stops it
+        yes = shutil.which("yes")
+        if yes is None:
+            self.skipTest("yes is not installed")
+        stdout = io.StringIO()
+        with open(os.devnull) as stdin, open(os.devnull, "w") as stderr:
+            sh = Shell(stdin, stdout, stderr, {}, None)
+            pipeline = [Command(yes, []), Cat("cat", []), Head("head", ["-n", "2"])]
+            self.assertEqual(0, sh._execute(pipeline))
+        self.assertEqual("y\ny\n", stdout.getvalue())
+
+    def test_pipeline_status(self):
+        sh = Shell(io.StringIO(), io.StringIO(), io.StringIO(), {}, None)
+        self.assertEqual(1, sh._execute([Echo("echo", ["a"]), Grep("grep", ["b"])]))
+        self.assertEqual(0, sh._execute([Echo("echo", ["a"]), Grep("grep", ["a"])]))
+
+
+class SortTest(ut.TestCase):
+    TEXT = "b 10\na 9\nc 10\nb 2"
+
+    def _sort(self, args: list[str], text: str = TEXT) -> str:
+        return _text(Sort("sort", args), text)[1]
+
+    def test_lines(self):
+        self.assertEqual("a 9\nb 10\nb 2\nc 10\n", self._sort([]))
+        self.assertEqual("c 10\nb 2\nb 10\na 9\n", self._sort(["-r"]))
+        self.assertEqual("a\nb\n", self._sort(["-u"], "b\na\nb\n"))
+
+    def test_keys(self):
+        self.assertEqual("b 10\nc 10\nb 2\na 9\n", self._sort(["-k2"]))
+        self.assertEqual("b 2\na 9\nb 10\nc 10\n", self._sort(["-n", "-k", "2"]))
+        self.assertEqual("a 9\nb 10\nc 10\n", self._sort(["-k1,1", "-u"]))
+        self.assertEqual("b 10\na 9\nb 2\n", self._sort(["-nru", "-k2,2"]))
+
+    def test_ties(self):
+        # like GNU sort in the C locale, lines compare without their newline
+        self.assertEqual("1\n1\ta\n", self._sort([], "1\ta\n1\n"))
+        self.assertEqual("1\ta\n1\n", self._sort(["-r"], "1\n1\ta\n"))
+        self.assertEqual("01\n1\n1 b\n", self._sort(["-n"], "1 b\n01\n1\n"))
+
+    def test_blanks(self):
+        # fields keep the blanks before them unless -b is given
+        self.assertEqual("a 2\na 2 \n", self._sort(["-k2", "-u"], "a 2 \na 2\n"))
+        text = "x  b\ny a\n"
+        self.assertEqual(text, self._sort(["-k2"], text))
+        self.assertEqual("y a\nx  b\n", self._sort(["-b", "-k2"], text))
+        self.assertEqual("y a\nx  b\n", self._sort(["-k2b"], text))
+        self.assertEqual("ba 1\nab 2\n", self._sort(["-k1.2,1.2"], "ab 2\nba 1\n"))
+
+    def test_numeric(self):
+        text = "10\n-2\n x\n2.5\n"
+        self.assertEqual("-2\n x\n2.5\n10\n", self._sort(["-n"], text))
+
+    def test_invalid(self):
+        for args in (["-x"], ["-k"], ["-k0"], ["-k1.0"], ["-k1,0"], ["-S", "1Q"]):
+            with self.assertRaises(ValueError):
+                self._sort(args)
+
+    def test_spill(self):
+        lines = [b"%d %d\n" % (i * 7919 % 1000, i % 3) for i in range(3000)]
+        data = b"".join(lines)
+        self.assertEqual(b"".join(sorted(lines)), _run(Sort("sort", ["-S1K"]), data))
+        # runs are merged in several passes and equal keys keep input order
+        sort = Sort("sort", ["-u", "-nk2"])
+        sort.memory_budget = 256
+        self.assertEqual(b"0 0\n919 1\n838 2\n", _run(sort, data))
+
+    def test_fused(self):
+        stdout = io.StringIO()
+        sh = Shell(io.StringIO(), stdout, io.StringIO(), {}, None)
+        pipeline = [Cat("cat", ["./tests/test.sh"]), Sort("sort", []), Wc("wc", ["-l"])]
+        with mock.patch("os.pipe", side_effect=AssertionError("pipe created")):
+            sh._execute(pipeline)
+        with open("./tests/test.sh") as f:
+            self.assertEqual(str(len(f.readlines())), stdout.getvalue())
+
+
+class Probe(Builtin):
+    """Sleeps a little, recording how many instances ran at the same time."""
+
+    streaming = binary_safe = pure = True
+    lock = threading.Lock()
+    running = peak = 0
+
+    def execute(self, env, stdin, stdout, stderr):
+        with Probe.lock:
+            Probe.running += 1
+            Probe.peak = max(Probe.peak, Probe.running)
+        time.sleep(0.02)
+        with Probe.lock:
+            Probe.running -= 1
+        stdout.write(f"{self.args[0]}\n".encode())
+
+
+class Gate(Builtin):
+    """Prints NAME of its NAME:AFTER argument once AFTER is done."""
+
+    streaming = binary_safe = pure = True
+    done: dict[str, threading.Event] = {}
+    # NAME is done once printed, otherwise the test marks it
+    marks = True
+
+    def execute(self, env, stdin, stdout, stderr):
+        name, after = self.args[0].split(":")
+        if after and not Gate.done[after].wait(10):
+            raise TimeoutError(f"{after} never finished")
+        stdout.write(f"{name}\n".encode())
+        if Gate.marks:
+            Gate.done[name].set()
+
+
+class _Marking(io.BytesIO):
+    """Output marking Gate names done when they are written to it."""
+
+    def write(self, data) -> int:
+        for name in bytes(data).split():
+            Gate.done[name.decode()].set()
+        return super().write(data)
+
+
+# pure builtins of the tests stay on threads, where they can be observed
+@mock.patch("cli.builtins.parallel._CPUS", 1)
+class ParallelTest(ut.TestCase):
+    ENV = {"PATH": os.defpath}
+
+    def _parallel(
+        self, items, template, jobs=4, keep_order=True, stderr=None, out=None
+    ):
+        out = io.BytesIO() if out is None else out
+        with open(os.devnull, "w") as devnull:
+            failed = parallel(
+                items, template, self.ENV, out, stderr or devnull, jobs, keep_order
+            )
+        return failed, out.getvalue().decode()
+
+    def test_template(self):
+        self.assertEqual((0, "xa\nxb\n"), self._parallel(["a", "b"], ["echo", "x{}"]))
+        self.assertEqual((0, "- a\n- b\n"), self._parallel(["a", "b"], ["echo", "-"]))
+
+    def test_order(self):
+        builtins.register("gate", Gate)
+        self.addCleanup(builtins.unregister, "gate")
+        self.addCleanup(setattr, Gate, "marks", True)
+        # a finishes after c, c after b
+        items = ["a:c", "b:", "c:b"]
+        Gate.done = {name: threading.Event() for name in "abc"}
+        self.assertEqual((0, "a\nb\nc\n"), self._parallel(items, ["gate"], jobs=3))
+        # without -k outputs are written in the order commands finish
+        Gate.done = {name: threading.Event() for name in "abc"}
+        Gate.marks = False
+        unordered = self._parallel(
+            items, ["gate"], jobs=3, keep_order=False, out=_Marking()
+        )
+        self.assertEqual((0, "b\nc\na\n"), unordered)
+
+    def test_bounded(self):
+        builtins.register("probe", Probe)
+        self.addCleanup(builtins.unregister, "probe")
+        Probe.peak = 0
+        items = [str(i) for i in range(12)]
+        failed, output = self._parallel(items, ["probe"], jobs=3)
+        self.assertEqual((0, "".join(f"{i}\n" for i in items)), (failed, output))
+        self.assertEqual(3, Probe.peak)
+
+    def test_failures(self):
+        with tempfile.TemporaryFile("w+") as stderr:
+            items = ["0", "3", "nope"]
+            failed, _ = self._parallel(items, ["sh", "-c", "exit {}"], stderr=stderr)
+            self.assertEqual(2, failed)
+            failed, _ = self._parallel(["a"], ["no-such-command-here"], stderr=stderr)
+            self.assertEqual(1, failed)
+            stderr.seek(0)
+            self.assertIn("no-such-command-here: command not found", stderr.read())
+
+    @mock.patch("cli.builtins.parallel._CPUS", 2)
+    def test_process_pool(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            items = []
+            for i in range(1, 5):
+                items.append(os.path.join(tmp, str(i)))
+                with open(items[-1], "w") as f:
+                    f.write("x\n" * i)
+            failed, output = self._parallel(items, ["wc", "-l", "{}"], jobs=2)
+            # counts of wc end without a newline, every item still gets a line
+            self.assertEqual((0, "1\n2\n3\n4\n"), (failed, output))
+            failed, output = self._parallel(items[:2], ["wc", "{}"], jobs=2)
+            self.assertEqual((0, "1 1 2\n2 2 4\n"), (failed, output))
+        stderr = io.StringIO()
+        self._parallel(["x"], ["wc", "-q"], stderr=stderr)
+        self.assertEqual("parallel: wc: invalid option -- 'q'\n", stderr.getvalue())
+
+    def test_shell(self):
+        with tempfile.TemporaryFile("w+") as out, open(os.devnull) as devnull:
+            sh = Shell(devnull, out, out, dict(self.ENV), CliParser())
+            status = sh.run(["echo a | parallel -P 2 -k sh -c 'exit 1'"])
+            self.assertEqual(123, status)
+            self.assertEqual(0, sh.run(["echo a | parallel -j1 echo {}{}"]))
+            out.seek(0)
+            self.assertEqual("aa\n", out.read())
+            with self.assertRaises(ValueError):
+                Parallel("parallel", ["-P", "0", "echo"]).execute({}, None, out, out)
+
+
+class RunTest(ut.TestCase):
+    def _run(self, lines: list[str]) -> tuple[int, str]:
+        stdout = io.StringIO()
+        sh = Shell(io.StringIO(), stdout, io.StringIO(), {}, CliParser({}))
+        status = sh.run(lines)
+        return status, stdout.getvalue()
+
+    def test_script(self):
+        status, output = self._run(["# comment\n", "echo a\n", "\n", "echo b"])
+        self.assertEqual((0, "a\nb\n"), (status, output))
+
+    def test_status(self):
+        with open(os.devnull, "r") as sin, open(os.devnull, "w") as sout:
+            sh = Shell(sin, sout, sout, {}, CliParser())
+            self.assertEqual(3, sh.run(["sh -c 'exit 3'"]))
+            self.assertEqual(0, sh.run(["sh -c 'exit 3'", "echo"]))
+            self.assertEqual(1, sh.run(["echo '"]))
+            self.assertEqual(1, sh.run(["no-such-command-here | cat"]))
+
+    def test_exit(self):
+        status, output = self._run(["echo a", "exit", "echo b"])
+        self.assertEqual((0, "a\n"), (status, output))
+
+    def test_no_prompt(self):
+        stdout = io.StringIO()
+        sh = Shell(io.StringIO("echo a\n"), stdout, io.StringIO(), {}, CliParser())
+        self.assertEqual(0, sh.run())
+        self.assertEqual("a\n", stdout.getvalue())
+
+    def test_script_stdin(self):
+        # builtins read the rest of a script piped in, after the shell read ahead
+        for command, expected in (("wc", "1 2 12"), ("sort", "hello world\n")):
+            rfd, wfd = os.pipe()
+            os.write(wfd, f"{command}\nhello world\n".encode())
+            os.close(wfd)
+            stdout = io.StringIO()
+            with open(rfd, "r") as stdin:
+                sh = Shell(stdin, stdout, io.StringIO(), {}, CliParser())
+                self.assertEqual(0, sh.run())
+            self.assertEqual(expected, stdout.getvalue())
+
+
+class RedirectTest(ut.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        with open(self._path("in"), "w") as f:
+            f.write("b\na\nc\n")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.tmp, name)
+
+    def _read(self, name: str) -> str:
+        with open(self._path(name)) as f:
+            return f.read()
+
+    def _run(self, *lines: str) -> int:
+        env = {"PATH": os.defpath}
+        with open(os.devnull, "r") as sin, open(os.devnull, "w") as sout:
+            sh = Shell(sin, sout, sout, env, CliParser(env))
+            return sh.run([line.format(tmp=self.tmp) for line in lines])
+
+    def test_builtins(self):
+        self._run("sort < {tmp}/in > {tmp}/out", "echo d >> {tmp}/out")
+        self.assertEqual("a\nb\nc\nd\n", self._read("out"))
+
+    def test_externals(self):
+        status = self._run(
+            "sort -r < {tmp}/in > {tmp}/out",
+            "ls {tmp}/missing 2> {tmp}/err",
+        )
+        self.assertNotEqual(0, status)
+        self.assertEqual("c\nb\na\n", self._read("out"))
+        self.assertIn("missing", self._read("err"))
+
+    def test_builtin_errors(self):
+        # reported to the redirected stderr of the stage, not the shell's
+        self.assertEqual(1, self._run("sort -Q {tmp}/in 2> {tmp}/err"))
+        self.assertIn("invalid option -- 'Q'", self._read("err"))
+        self.assertEqual(1, self._run("cat {tmp}/in | sort -Q 2> {tmp}/err"))
+        self.assertIn("invalid option -- 'Q'", self._read("err"))
+
+    def test_pipeline(self):
+        # redirected output replaces the pipe, the next stage sees no input
+        self._run("cat {tmp}/in > {tmp}/out | wc -l > {tmp}/count")
+        self.assertEqual(("b\na\nc\n", "0"), (self._read("out"), self._read("count")))
+        self._run("cat < {tmp}/in | tr a-c A-C | cat > {tmp}/out")
+        self.assertEqual("B\nA\nC\n", self._read("out"))
+
+    def test_no_leaked_files(self):
+        fds = len(os.listdir("/dev/fd"))
+        self.assertEqual(1, self._run("cat < {tmp}/in > {tmp}/out < {tmp}/missing"))
+        self.assertEqual(0, self._run("cat < {tmp}/in | cat > {tmp}/out"))
+        self.assertEqual(fds, len(os.listdir("/dev/fd")))
+
+
+class EnvironmentTest(ut.TestCase):
+    def test_encoded(self):
+        env = Environment({"a": "1", "b": "2"})
+        first = env.encoded()
+        self.assertEqual({b"a": b"1", b"b": b"2"}, first)
+        self.assertIs(first, env.encoded())
+        env["a"] = "x"
+        del env["b"]
+        self.assertEqual({b"a": b"x"}, env.encoded())
+        # a snapshot already handed out never changes
+        self.assertEqual({b"a": b"1", b"b": b"2"}, first)
+        self.assertRaises(KeyError, env.__delitem__, "b")
+
+    def test_copy(self):
+        base = Environment({"a": "1", "b": "2"})
+        encoded = base.encoded()
+        env = base.copy()
+        self.assertIs(encoded, env.encoded())
+        env["a"] = "x"
+        del env["b"]
+        env["c"] = "3"
+        self.assertEqual({"a": "x", "c": "3"}, dict(env))
+        self.assertEqual({"a": "1", "b": "2"}, dict(base))
+        self.assertNotIn("b", env)
+        # a copy is a snapshot, later changes of the original are not seen
+        base["d"] = "4"
+        self.assertNotIn("d", env)
+        self.assertEqual({b"a": b"x", b"c": b"3"}, env.encoded())
+        self.assertEqual({b"a": b"1", b"b": b"2", b"d": b"4"}, base.encoded())
+        self.assertEqual(
+            {"a": "1", "b": "2", "d": "4", "e": "5"}, base.overlay({"e": "5"})
+        )
+
+    def test_background(self):
+        env = Environment({"PATH": os.defpath})
+        out = tempfile.TemporaryFile("w+")
+        with open(os.devnull, "r") as sin, out:
+            sh = Shell(sin, out, out, env, CliParser(env))
+            lines = ["x=1", "sh -c 'sleep 0.2' && sh -c 'echo bg x=$x' &", "x=5"]
+            sh.run(lines + ["sh -c 'echo x=$x'", "wait"])
+            out.seek(0)
+            self.assertEqual("x=5\nbg x=1\n", out.read())
+
+    def test_spawn(self):
+        env = Environment({"PATH": os.defpath})
+        out = tempfile.TemporaryFile("w+")
+        with open(os.devnull, "r") as sin, out:
+            sh = Shell(sin, out, out, env, CliParser(env))
+            sh.run(["sh -c 'echo $a'", "a=1", "sh -c 'echo $a'", "echo $a"])
+            out.seek(0)
+            self.assertEqual("\n1\n1\n", out.read())
+        for backend in (POSIX_SPAWN, POPEN):
+            with self.subTest(backend=backend):
+                reader, writer = pipe()
+                with reader, open(os.devnull, "r") as sin:
+                    with writer:
+                        process = spawn(
+                            ["sh", "-c", "echo $a"],
+                            shutil.which("sh"),
+                            env.overlay({"a": "2"}),
+                            sin,
+                            writer,
+                            writer,
+                            backend,
+                        )
+                    self.assertEqual("2\n", reader.read())
+                process.wait()
+
+
+class JobsTest(ut.TestCase):
+    def _run(self, lines: list[str], stdin: str = "") -> tuple[int, str, str]:
+        # external commands need real descriptors
+        files = [tempfile.TemporaryFile("w+") for _ in range(3)]
+        sin, sout, serr = files
+        try:
+            sin.write(stdin)
+            sin.seek(0)
+            env: dict = {}
+            sh = Shell(sin, sout, serr, env, CliParser(env))
+            status = sh.run(lines)
+            self.assertEqual({}, sh.jobs)
+            sout.seek(0)
+            serr.seek(0)
+            return status, sout.read(), serr.read()
+        finally:
+            for f in files:
+                f.close()
+
+    def test_sequence(self):
+        lines = ["echo a; echo b", "sh -c 'exit 2' && echo x; echo c", "echo d &&"]
+        status, output, error = self._run(lines)
+        self.assertEqual((1, "a\nb\nc\n"), (status, output))
+        self.assertIn("SyntaxError", error)
+        status, output, _ = self._run(["sh -c 'exit 3' && echo x && echo y"])
+        self.assertEqual((3, ""), (status, output))
+
+    def test_background(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fifo = os.path.join(tmp, "fifo")
+            os.mkfifo(fifo)
+            # slow goes on once fast has been printed
+            lines = [
+                f"sh -c 'read go < {fifo}; echo slow' &",
+                f"sh -c 'echo fast; echo go > {fifo}'",
+                "wait",
+            ]
+            self.assertEqual((0, "fast\nslow\n", ""), self._run(lines))
+        # everything left running is waited for once input ends
+        status, output, _ = self._run(["sh -c 'sleep 0.1' && echo a | cat &"])
+        self.assertEqual((0, "a\n"), (status, output))
+
+    def test_wait_status(self):
+        self.assertEqual(3, self._run(["sh -c 'exit 3' &", "wait %1"])[0])
+        status, _, error = self._run(["wait 7"])
+        self.assertEqual((127, "wait: 7: no such job\n"), (status, error))
+
+    def test_jobs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fifo = os.path.join(tmp, "fifo")
+            os.mkfifo(fifo)
+            # external commands need real descriptors
+            stdout = tempfile.TemporaryFile("w+")
+            self.addCleanup(stdout.close)
+            with open(os.devnull, "r+") as devnull:
+                sh = Shell(devnull, stdout, devnull, {}, CliParser())
+                sh._run_list(sh.parser.split(f"cat {fifo} & sh -c 'exit 5' &"))
+                _, exiting = sh.jobs.values()
+                # exited but not reaped, cat runs until fifo is opened for writing
+                os.waitid(os.P_PID, exiting.pid, os.WEXITED | os.WNOWAIT)
+                sh._run_list(sh.parser.split("jobs; jobs"))
+                with open(fifo, "w"):
+                    pass
+                self.assertEqual(0, sh.wait())
+        stdout.seek(0)
+        self.assertEqual(
+            f"[1]  Running cat {fifo}\n[2]  Exit 5  sh -c exit 5\n"
+            f"[1]  Running cat {fifo}\n",
+            stdout.read(),
+        )
+
+    def test_reap(self):
+        with open(os.devnull, "w") as devnull:
+            sh = Shell(io.StringIO(), devnull, devnull, {}, CliParser())
+            sh._run_list(CliParser().split("sh -c 'exit 4' &"))
+            (job,) = sh.jobs.values()
+            # exited but not reaped, reap must not block or wait for it
+            os.waitid(os.P_PID, job.pid, os.WEXITED | os.WNOWAIT)
+            self.assertEqual([job], sh.reap())
+            self.assertRaises(ChildProcessError, os.waitpid, job.pid, os.WNOHANG)
+            self.assertEqual(4, job.status)
+            self.assertEqual(4, sh.wait(job.id))
+
+    def test_isolated(self):
+        lines = ["a=1 && echo x &", "cat &", "wait", "echo $a"]
+        self.assertEqual((0, "x\n\n", ""), self._run(lines, stdin="not for cat\n"))
+        # single builtins in the background get a copy too
+        self.assertEqual((0, "\n", ""), self._run(["a=2 &", "wait", "echo $a"]))
+        lines = ["a=1", "a=2 && sh -c 'echo $a' &", "wait", "echo $a"]
+        self.assertEqual((0, "2\n1\n", ""), self._run(lines))
+
+    def test_expanded_when_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            lines = [
+                "a=1; echo $a",
+                'x=2 && echo "v=$x"',
+                f"f={tmp}/o; echo z > $f; cat $f",
+            ]
+            self.assertEqual((0, "1\nv=2\nz\n", ""), self._run(lines))
+
+    def test_forget_done(self):
+        with open(os.devnull, "w") as devnull:
+            sh = Shell(io.StringIO(), devnull, devnull, {}, CliParser())
+            sh.keep_done = 2
+            for _ in range(5):
+                sh._run_list(sh.parser.split("true &"))
+                for job in sh.jobs.values():
+                    job.wait(check=False)
+                sh._notify(interactive=False)
+            # only the newest finished jobs are kept for `wait`
+            self.assertEqual([4, 5], sorted(sh.jobs))
+            self.assertEqual(0, sh.wait(5))
+
+
+class ProfileTest(ut.TestCase):
+    def test_records(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profile.jsonl")
+            profiler = Profiler(path)
+            with open(os.devnull, "r") as sin, open(os.devnull, "w") as sout:
+                sh = Shell(sin, sout, sout, {}, CliParser(), profiler=profiler)
+                script = ["echo hello | cat | wc -c", "sh -c 'exit 3'"]
+                self.assertEqual(3, sh.run(script))
+            profiler.close()
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+
+        self.assertEqual(script, [record["line"] for record in records])
+        fused, external = records
+        self.assertGreater(fused["lex"], 0)
+        self.assertGreater(fused["factory"], 0)
+        echo, cat, wc = fused["stages"]
+        self.assertEqual("cat", cat["name"])
+        self.assertEqual((6, 6), (cat["bytes_in"], cat["bytes_out"]))
+        self.assertEqual(6, wc["bytes_in"])
+        (sh_stage,) = external["stages"]
+        self.assertEqual(3, external["status"])
+        self.assertFalse(sh_stage["builtin"])
+        self.assertGreater(sh_stage["spawn"], 0)
+        self.assertGreaterEqual(sh_stage["wall"], sh_stage["spawn"])
+        self.assertIsNotNone(sh_stage["cpu"])
+
+    def test_command_list(self):
+        stdout = io.StringIO()
+        env: dict = {}
+        parser = CliParser(env)
+        sh = Shell(io.StringIO(), stdout, io.StringIO(), env, parser, Profiler())
+        self.assertEqual(0, sh.run(["a=1; echo $a && echo b"]))
+        self.assertEqual("1\nb\n", stdout.getvalue())
+
+    def test_times(self):
+        stdout = io.StringIO()
+        sh = Shell(io.StringIO(), stdout, io.StringIO(), {}, CliParser(), Profiler())
+        sh.run(["echo a | cat", "times"])
+        self.assertIn("1 lines: parse", stdout.getvalue())
+        self.assertRegex(stdout.getvalue(), r"\ncat +1 ")
+        stdout = io.StringIO()
+        Shell(io.StringIO(), stdout, io.StringIO(), {}, CliParser()).run(["times"])
+        self.assertRegex(stdout.getvalue(), r"^\d+m\d+\.\d{3}s \d+m\d+\.\d{3}s\n")
+
+
+class PathCacheTest(ut.TestCase):
+    def setUp(self):
+        path_cache.clear()
+
+    def test_hits(self):
+        env = {"PATH": os.defpath}
+        first = path_cache.lookup("sh", env)
+        self.assertEqual(first, path_cache.lookup("sh", env))
+        self.assertEqual([("sh", first, 2)], path_cache.entries())
+        self.assertIsNone(path_cache.lookup("./tests/test.sh", env))
+
+    def test_path_change(self):
+        env = {"PATH": os.defpath}
+        path_cache.lookup("sh", env)
+        Eq("=", ["PATH", "/nonexistent"]).execute(env, None, None, None)
+        self.assertEqual([], path_cache.entries())
+        self.assertIsNone(path_cache.lookup("sh", env))
+
+    def test_hash(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        env = {"PATH": os.defpath}
+        Hash("hash", ["sh", "no-such-command-here"]).execute(env, None, stdout, stderr)
+        Hash("hash", []).execute(env, None, stdout, stderr)
+        self.assertIn("sh\n", stdout.getvalue())
+        self.assertIn("no-such-command-here: not found", stderr.getvalue())
+        Hash("hash", ["-r"]).execute(env, None, stdout, stderr)
+        self.assertEqual([], path_cache.entries())
+
+
+class SpawnTest(ut.TestCase):
+    def _spawn(self, backend: str, script: str) -> tuple[int, bytes]:
+        out = os.pipe()
+        with open(os.devnull, "r") as sin, open(out[1], "w") as sout:
+            process = spawn(
+                ["sh", "-c", script], shutil.which("sh"), {}, sin, sout, sout, backend
+            )
+        with open(out[0], "rb") as res:
+            return process.wait(), res.read()
+
+    def test_backends(self):
+        for backend in (POSIX_SPAWN, POPEN):
+            with self.subTest(backend=backend):
+                self.assertEqual((3, b"hi\n"), self._spawn(backend, "echo hi; exit 3"))
+
+    def test_signal(self):
+        self.assertEqual(-9, self._spawn(POSIX_SPAWN, "kill -9 $$")[0])
+
+    def test_fallback(self):
+        # no descriptor to hand to posix_spawn
+        process = spawn(["true"], shutil.which("true"), {}, None, None, None)
+        self.assertIsInstance(process, subprocess.Popen)
+        self.assertEqual(0, process.wait())
+
+
+class FusionTest(ut.TestCase):
+    def test_no_descriptors(self):
+        pipeline = [Echo("echo", ["a b"]), Cat("cat", []), Wc("wc", [])]
+        stdout = io.StringIO()
+        sh = Shell(io.StringIO(), stdout, io.StringIO(), {}, None)
+        with mock.patch("os.pipe", side_effect=AssertionError("pipe created")):
+            sh._execute(pipeline)
+        self.assertEqual("1 2 4", stdout.getvalue())
+
+    def test_large(self):
+        data = bytes(range(256)) * 4096
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            pipeline = [Cat("cat", [f.name]), Cat("cat", []), Cat("cat", [])]
+            out = os.pipe()
+            with open(out[1], "w") as sout:
+                sh = Shell(None, sout, io.StringIO(), {}, None)
+                result = []
+                reader = threading.Thread(target=lambda: result.append(_read(out[0])))
+                reader.start()
+                sh._execute(pipeline)
+            reader.join()
+        self.assertEqual(data, result[0])
+
+    def test_binary_safe(self):
+        class Check(Cat):
+            binary_safe = False
+
+            def execute(self, env, stdin, stdout, stderr):
+                seen.append(isinstance(stdin, io.TextIOBase))
+                super().execute(env, stdin, stdout, stderr)
+
+        seen = []
+        stdout = io.StringIO()
+        sh = Shell(io.StringIO(), stdout, io.StringIO(), {}, None)
+        sh._execute([Echo("echo", ["a"]), Check("cat", []), Wc("wc", ["-c"])])
+        self.assertEqual("2", stdout.getvalue())
+        self.assertEqual([True], seen)
+        Check.binary_safe = True
+        sh._execute([Echo("echo", ["a"]), Check("cat", [])])
+        self.assertEqual([True, False], seen)
+
+    def test_memory_pipe_reader_closed(self):
+        reader, writer = memory_pipe(capacity=4)
+        writer.write(b"abcd")
+        reader.close()
+        with self.assertRaises(BrokenPipeError):
+            writer.write(b"efgh")
+
+    def test_no_leaked_pipes(self):
+        fds = len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else 0
+        with open(os.devnull, "r") as sin, open(os.devnull, "w") as sout:
+            sh = Shell(sin, sout, sout, {}, CliParser())
+            for _ in range(50):
+                sh.run(["no-such-command-here | cat | no-such-command-here | cat"])
+            with mock.patch("cli.shell.workers.submit", side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    sh._execute([Command("true", []), Cat("cat", []), Wc("wc", [])])
+        self.assertEqual(0, open_pipe_fds())
+        if fds:
+            self.assertEqual(fds, len(os.listdir("/proc/self/fd")))
+
+    @ut.skipUnless(sys.platform == "linux", "pipe size can only be set on Linux")
+    def test_pipe_size(self):
+        reader, writer = pipe(1 << 20)
+        try:
+            # F_GETPIPE_SZ
+            size = fcntl.fcntl(writer.fileno(), 1032)
+            with open("/proc/sys/fs/pipe-max-size") as f:
+                self.assertEqual(min(1 << 20, int(f.read())), size)
+            self.assertEqual(2, open_pipe_fds())
+        finally:
+            reader.close()
+            writer.close()
+        self.assertEqual(0, open_pipe_fds())
+
+
+def _read(fd: int) -> bytes:
+    with open(fd, "rb") as f:
+        return f.read()
+
+
+class WorkersTest(ut.TestCase):
+    def test_concurrent(self):
+        # tasks that wait for each other must not queue behind each other
+        pool = Workers(idle_timeout=0.1)
+        barrier = threading.Barrier(4)
+        tasks = [pool.submit(barrier.wait, 5) for _ in range(4)]
+        for task in tasks:
+            self.assertTrue(task.join(5))
+
+    def test_reuse(self):
+        pool = Workers()
+        pool.submit(lambda: None).join()
+        before = threading.active_count()
+        pool.submit(lambda: None).join()
+        self.assertEqual(before, threading.active_count())
+
+
+class PlanTest(ut.TestCase):
+    def test_execute(self):
+        stdout = io.StringIO()
+        sh = Shell(io.StringIO(), stdout, io.StringIO(), {"a": "1"}, CliParser())
+        plan = sh.prepare("echo $a $b | wc -w")
+        self.assertEqual(0, sh.execute(plan))
+        self.assertEqual(0, sh.execute(plan, {"a": "1", "b": "2"}))
+        self.assertEqual("12", stdout.getvalue())
+
+
+class ServerTest(ut.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "cli.sock")
+        self.server = ShellServer(self.path, {"PATH": os.defpath}, workers=2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.dir.cleanup()
+
+    def _session(self, script: str) -> bytes:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(self.path)
+            conn.sendall(script.encode())
+            conn.shutdown(socket.SHUT_WR)
+            with conn.makefile("rb") as f:
+                return f.read()
+
+    def test_session(self):
+        output = self._session("echo hello | wc -w\nls -d /\n")
+        self.assertEqual(b"1/\n", output)
+
+    def test_isolated(self):
+        self.assertEqual(b"b\n", self._session("a=b\necho $a\n"))
+        self.assertEqual(b"\n", self._session("echo $a\n"))
+
+    def test_concurrent(self):
+        outputs: list[bytes] = []
+
+        def session(i: int):
+            outputs.append(self._session(f"echo {i}"))
+
+        threads = [threading.Thread(target=session, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([f"{i}\n".encode() for i in range(8)], sorted(outputs))
+
+    def test_live_socket(self):
+        # socket of a running server is neither taken over nor removed
+        with self.assertRaises(OSError):
+            ShellServer(self.path, {})
+        self.assertEqual(b"a\n", self._session("echo a"))
+
+    def test_stale_socket(self):
+        path = os.path.join(self.dir.name, "stale.sock")
+        # bound and closed without unlinking, like after a crash
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as left:
+            left.bind(path)
+        with ShellServer(path, {}) as server:
+            self.assertEqual(path, server.server_address)
+        self.assertFalse(os.path.exists(path))
+
+    def test_arguments(self):
+        for argv in (
+            ["--workers", "2", "-c", "echo"],
+            ["--serve", "s", "--profile", "p"],
+        ):
+            with mock.patch("sys.stderr", io.StringIO()) as stderr:
+                with self.assertRaises(SystemExit):
+                    main(argv)
+            self.assertIn("error: --", stderr.getvalue())
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import unittest as ut
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# microseconds `import cli.__main__` may take, measured with -X importtime
+BUDGET = 150_000
+
+# modules that are only needed once a command actually uses them
+LAZY = [
+    "argparse",
+    "cli.builtins.cat",
+    "cli.builtins.wc",
+    "cli.server",
+    "cli.spawn",
+    "concurrent.futures",
+    "multiprocessing",
+    "shutil",
+    "socketserver",
+    "subprocess",
+    "traceback",
+]
+
+
+def importtime(module: str) -> dict[str, int]:
+    """Cumulative import time of every module imported with module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class StartupTest(ut.TestCase):
+    def test_lazy_imports(self):
+        imported = importtime("cli.__main__")
+        self.assertEqual([], [module for module in LAZY if module in imported])
+
+    def test_budget(self):
+        best = min(importtime("cli.__main__")["cli.__main__"] for _ in range(3))
+        self.assertLess(best, BUDGET)